@@ -1,10 +1,21 @@
 import json
 import os
 import base64
+import hashlib
+import io
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from json_store import JsonStore
+from processing_events import ProcessingNotifier
+
+try:
+    from PIL import Image
+except ImportError:  # Originals are still stored, just without thumbnails
+    Image = None
 
 # Define the base directory as the directory where this script is located
 base_dir = os.path.dirname(__file__)
@@ -13,123 +24,229 @@ img_dir = os.path.join(web_dir, "img")  # Path to the img directory
 uplaod_dir = os.path.join(img_dir, "upload") # Path to the upload directory
 db_file_path = os.path.join(web_dir, "db.json")  # Path to db.json
 products_file_path = os.path.join(web_dir, "products.json")  # Path to products.json
+thumb_dir = os.path.join(img_dir, "thumb")  # Path to the downscaled WebP variants
+
+THUMBNAIL_SIZE = (256, 256)
+# Leading bytes of the formats the UI can display
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpeg",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+}
+
+# Pillow releases the GIL while decoding and resizing, so threads run in parallel
+image_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+
+# Shared with reference.py; the store's lock file keeps both processes' writes apart
+ingredient_store = JsonStore(db_file_path, key="ING_ID")
+product_store = JsonStore(products_file_path, key="PID")
 
-# Create a global completion event that will be imported by app.py
-processing_complete = threading.Event()
+# Tells the server when each record has been processed; reference.py connects it
+notifier = ProcessingNotifier()
 
 class JsonChangeHandler(FileSystemEventHandler):
-    def __init__(self):
-        self.is_processing = False  # Flag to prevent re-entrance
-        
-    def process_json(self, file_path, type_):
-        self.is_processing = True  # Set the flag to indicate processing has started
-        processing_complete.clear()  # Reset the completion event
+    """Turns bursts of file events into one processing pass per store.
+
+    Events only mark a store dirty; a single worker thread processes each dirty
+    store once no event has arrived for `debounce` seconds, or `max_delay` seconds
+    into a continuous burst. Events caused by this process's own writes are
+    recognised by the store and skipped, so a writer in the same process queues
+    its records with `schedule` instead.
+    """
+    def __init__(self, debounce=0.25, max_delay=2.0):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        # Per store: the version processed last and a content hash per record id
+        self.versions = {}
+        self.record_hashes = {}
+        self.stores = {
+            db_file_path: (ingredient_store, "ingredient"),
+            ingredient_store.journal_path: (ingredient_store, "ingredient"),
+            products_file_path: (product_store, "product"),
+            product_store.journal_path: (product_store, "product"),
+        }
+        self._dirty = {}  # (store, type_) -> (first event time, time processing is due)
+        self._scheduled = set()  # Dirty targets to process even without external changes
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._process_dirty, name="json-worker", daemon=True)
+        self._worker.start()
+
+    def on_any_event(self, event):
+        # Compaction replaces the snapshot, which arrives as a move onto it
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            target = self.stores.get(path)
+            if target is not None:
+                self._mark_dirty(target)
+
+    def schedule(self, store, type_):
+        """Process records this process appended to `store`, which its events skip"""
+        self._mark_dirty((store, type_), scheduled=True)
+
+    def _mark_dirty(self, target, scheduled=False):
+        now = time.monotonic()
+        with self._cond:
+            first = self._dirty.get(target, (now, None))[0]
+            self._dirty[target] = (first, min(now + self.debounce, first + self.max_delay))
+            if scheduled:
+                self._scheduled.add(target)
+            self._cond.notify()
+
+    def _process_dirty(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [target for target, (_, deadline) in self._dirty.items() if deadline <= now]
+                    if due:
+                        break
+                    timeout = min(deadline for _, deadline in self._dirty.values()) - now if self._dirty else None
+                    self._cond.wait(timeout)
+                scheduled = self._scheduled.intersection(due)
+                for target in due:
+                    del self._dirty[target]
+                    self._scheduled.discard(target)
+            for store, type_ in due:
+                if (store, type_) in scheduled or store.has_external_changes():
+                    print(f"{store.path} has been modified.")
+                    self.process_json(store, type_)
+
+    def process_json(self, store, type_):
         try:
-            with open(file_path, "r") as file:
-                data = json.load(file)
-
-            # Track if any changes are made
-            changes_made = False
-            
-            if type_ == "ingredient":
-                # Process ingredients from db.json
-                for ingredient in data:
-                    if "ING_IMG" in ingredient and ingredient["ING_IMG"]:
-                        original_img = ingredient["ING_IMG"]
-                        save_image(ingredient, "ingredient")
-                        if ingredient["ING_IMG"] != original_img:
-                            changes_made = True
-            else:
-                # Process products from products.json
-                for product in data:
-                    if "PImage" in product and product["PImage"]:
-                        original_img = product["PImage"]
-                        save_image(product, "product")
-                        if product["PImage"] != original_img:
-                            changes_made = True
-
-            # Save the updated file only if changes were made
-            if changes_made:
-                with open(file_path, "w") as file:
-                    json.dump(data, file, indent=2)
+            img_key = "ING_IMG" if type_ == "ingredient" else "PImage"
+            hashes = self.record_hashes.setdefault(store.path, {})
+            version, changed = store.changed_since(self.versions.get(store.path, 0))
+
+            # Only records that changed since the last pass and whose content differs
+            pending = []
+            for position, item in changed:
+                record_id = item.get(store.key, position)
+                digest = record_hash(item)
+                if hashes.get(record_id) == digest:
+                    continue
+                hashes[record_id] = digest
+                if item.get(img_key) and 'base64,' in item[img_key]:
+                    pending.append((position, record_id, item))
+                else:
+                    notifier.notify(type_, record_id, "done", image=item.get(img_key))
+
+            thumb_key = "ING_THUMB" if type_ == "ingredient" else "PThumb"
+            # Decode the whole batch in parallel, then record results in order
+            results = image_pool.map(lambda entry: store_image(entry[2][img_key]), pending)
+            for (position, record_id, item), result in zip(pending, results):
+                if result is None:
+                    notifier.notify(type_, record_id, "error")
+                    continue
+                updated = dict(item)
+                updated[img_key], thumbnail = result
+                if thumbnail:
+                    updated[thumb_key] = thumbnail
+                store.update(position, updated)
+                # Our own write shows up as a change next pass; its hash marks it as seen
+                hashes[record_id] = record_hash(updated)
+                notifier.notify(type_, record_id, "done", image=updated[img_key], thumbnail=thumbnail)
+            self.versions[store.path] = version
 
         except Exception as e:
-            print(f"Error processing {db_file_path}: {e}")
-        finally:
-            self.is_processing = False  # Reset the flag after processing
-            processing_complete.set()  # Set the completion event
-
+            print(f"Error processing {store.path}: {e}")
+
+def record_hash(item):
+    return hashlib.sha1(json.dumps(item, sort_keys=True).encode()).hexdigest()
+
+def sniff_format(image_bytes):
+    for signature, format_ in IMAGE_SIGNATURES.items():
+        if image_bytes.startswith(signature):
+            return format_
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def make_thumbnail(image_bytes, digest):
+    """Write a WebP thumbnail for the image and return its URL, or None without Pillow"""
+    if Image is None:
+        return None
+    filename = f"{digest}.webp"
+    file_path = os.path.join(thumb_dir, filename)
+    if not os.path.exists(file_path):
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            os.makedirs(thumb_dir, exist_ok=True)
+            temporary_path = f"{file_path}.tmp"
+            image.save(temporary_path, "WEBP", quality=80)
+        os.replace(temporary_path, file_path)
+    return f"/img/thumb/{filename}"
+
+def store_image(img_data):
+    """Decode a base64 data URL and store it; returns (image URL, thumbnail URL) or None"""
+    try:
+        encoded = img_data.split(',', 1)[1]
+        image_bytes = base64.b64decode(encoded, validate=True)
+        extension = sniff_format(image_bytes)
+        if extension is None:
+            raise ValueError("not a PNG, JPEG, GIF or WebP image")
+        if Image is not None:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                image.verify()
+
+        # Name the file after its content so identical uploads share one file
+        digest = hashlib.sha256(image_bytes).hexdigest()[:16]
+        filename = f"{digest}.{extension}"
+        file_path = os.path.join(uplaod_dir, filename)
+        if not os.path.exists(file_path):
+            temporary_path = f"{file_path}.tmp"
+            with open(temporary_path, "wb") as img_file:
+                img_file.write(image_bytes)
+            os.replace(temporary_path, file_path)
+            print(f"Image saved at: {file_path}")
 
-    def on_modified(self, event):
-        if event.src_path == db_file_path and not self.is_processing:
-            print(f"{db_file_path} has been modified.")
-            self.process_json(db_file_path, "ingredient")
-            
-        elif event.src_path == products_file_path and not self.is_processing:
-            print(f"{products_file_path} has been modified.")
-            self.process_json(products_file_path, "product")
+        return f"/img/upload/{filename}", make_thumbnail(image_bytes, digest)
+    except Exception as e:
+        print(f"Error saving image: {e}")
+        return None
 
 def save_image(item, type_):
-    # Create processing flag file
-    with open(os.path.join(web_dir, 'processing'), 'w') as f:
-        f.write('1')
-        
     if type_ == "ingredient":
         img_data = item.get("ING_IMG")
         name = item.get("ING_Name")
-        img_key = "ING_IMG"
+        img_key, thumb_key = "ING_IMG", "ING_THUMB"
     else:
         img_data = item.get("PImage")
         name = item.get("PName")
-        img_key = "PImage"
+        img_key, thumb_key = "PImage", "PThumb"
     
     # Check if the image data is in Base64 format
     if img_data and 'base64,' in img_data:
-        print(f"Processing Base64 image data for {name}: {img_data}")
-        try:
-            # Extract the Base64 part
-            header, encoded = img_data.split(',', 1)
-            extension = header.split(';')[0].split('/')[1]  # Get the image type
-
-            # Create a filename based on the name and extension
-            filename = f"{name.replace(' ', '_').lower()}.{extension}"
-            file_path = os.path.join(uplaod_dir, filename)
-
-            # Write the image to a file
-            with open(file_path, "wb") as img_file:
-                img_file.write(base64.b64decode(encoded))
-            
-            # Update the item's image path
-            item[img_key] = f"/img/upload/{filename}"
-
-            print(f"Image saved at: {file_path}")
-            
-            # Remove processing flag file after successful save
-            flag_path = os.path.join(web_dir, 'processing')
-            if os.path.exists(flag_path):
-                os.remove(flag_path)
-        except Exception as e:
-            print(f"Error saving image for {name}: {e}")
+        print(f"Processing Base64 image data for {name}")
+        result = store_image(img_data)
+        if result is not None:
+            item[img_key], thumbnail = result
+            if thumbnail:
+                item[thumb_key] = thumbnail
 
     # Check if the image data is a file path
     elif img_data and img_data.startswith("/img/upload/"):
         print(f"Image already formatted for {name}: {img_data}")
 
+def create_observer(event_handler=None):
+    """An Observer that feeds changes in the static folder to a JsonChangeHandler"""
+    observer = Observer()
+    observer.schedule(event_handler or JsonChangeHandler(), path=web_dir, recursive=False)
+    return observer
+
 # Start watching for changes in db.json
 def start_watching():
-    event_handler = JsonChangeHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=web_dir, recursive=False)
+    observer = create_observer()
     observer.start()
     print("Watching for changes in db.json...")
 
     try:
-        while True:
-            time.sleep(1)  # Sleep to prevent busy waiting
+        observer.join()  # Returns when the observer stops
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
 
 if __name__ == "__main__":
     # Start watching
-    start_watching()
\ No newline at end of file
+    start_watching()
@@ -0,0 +1,260 @@
+"""Append-only storage for db.json and products.json.
+
+Each collection is a snapshot (the original JSON list, e.g. db.json) plus a
+JSON-lines journal next to it (db.jsonl). Adding or updating a record appends a
+single journal line instead of rewriting the whole file; once the journal grows
+past `compact_every` entries it is folded back into the snapshot, which is
+replaced atomically.
+
+Every journal entry names the list position it writes, so replaying entries
+that already made it into the snapshot (a crash between replacing the snapshot
+and truncating the journal) is harmless.
+
+The server and image_handler.py both open the same store. A lock file makes
+writes exclusive across processes, and each process catches up on the other's
+writes by reading the journal from where it last stopped.
+"""
+import json
+import os
+import threading
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """Exclusive lock shared by threads and processes, held on `<path>.lock`"""
+
+    def __init__(self, path):
+        self.path = f"{path}.lock"
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            self._file = open(self.path, "a+b")
+            if os.name == "nt":
+                while True:
+                    try:
+                        self._file.seek(0)
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            if os.name == "nt":
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+class JsonStore:
+    """A JSON list on disk with O(1) appends and an in-memory index by `key`"""
+
+    def __init__(self, path, key=None, compact_every=500):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".jsonl"
+        self.key = key
+        self.compact_every = compact_every
+        self.lock = FileLock(path)
+        self.version = 0
+        self._records = []
+        self._stamps = []  # Version at which each position last changed
+        self._index = {}
+        self._snapshot_mtime = -1  # Forces a full load on first use
+        self._offset = 0  # End of the last complete journal line applied
+        self._entries = 0
+        self._serialized = None
+
+    def _load_snapshot(self):
+        try:
+            with open(self.path, "r") as file:
+                content = file.read()
+            self._snapshot_mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            content = ""
+            self._snapshot_mtime = None
+        records = json.loads(content) if content.strip() else []
+        return records if isinstance(records, list) else []
+
+    def _reload(self):
+        self._records = self._load_snapshot()
+        self._stamps = [self.version + 1] * len(self._records)
+        self._offset = 0
+        self._entries = 0
+        self._rebuild_index()
+        self._catch_up()
+        self._changed()
+
+    def _rebuild_index(self):
+        self._index = {}
+        if self.key:
+            for position, record in enumerate(self._records):
+                if isinstance(record, dict) and self.key in record:
+                    self._index[record[self.key]] = position
+
+    def _apply(self, entry):
+        position, record = entry["pos"], entry["record"]
+        # Every batch of applied entries is followed by one _changed()
+        if position < len(self._records):
+            self._records[position] = record
+            self._stamps[position] = self.version + 1
+        elif position == len(self._records):
+            self._records.append(record)
+            self._stamps.append(self.version + 1)
+        else:
+            raise ValueError(f"Journal entry for position {position} beyond {len(self._records)} records")
+        if self.key and isinstance(record, dict) and self.key in record:
+            self._index[record[self.key]] = position
+
+    def _catch_up(self):
+        """Apply journal lines written since the last read; returns how many were applied"""
+        try:
+            with open(self.journal_path, "rb") as journal:
+                journal.seek(self._offset)
+                data = journal.read()
+        except FileNotFoundError:
+            return 0
+        # A partial final line belongs to a write still in progress, or one that never finished
+        end = data.rfind(b"\n") + 1
+        applied = 0
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+                applied += 1
+        self._offset += end
+        self._entries += applied
+        return applied
+
+    def _changed(self):
+        self.version += 1
+        self._serialized = None
+
+    def has_external_changes(self):
+        """Whether another writer touched the files since this process last read or wrote them.
+
+        Only stats the files, so a watcher can cheaply ignore events caused by its own writes.
+        """
+        try:
+            snapshot_mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            snapshot_mtime = None
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_size = 0
+        return snapshot_mtime != self._snapshot_mtime or journal_size != self._offset
+
+    def refresh(self):
+        """Pick up writes made by other processes; returns True if anything changed"""
+        with self.lock:
+            snapshot_mtime = None
+            if os.path.exists(self.path):
+                snapshot_mtime = os.stat(self.path).st_mtime_ns
+            journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+            if snapshot_mtime != self._snapshot_mtime or journal_size < self._offset:
+                # Compacted (or replaced) by someone else
+                self._reload()
+                return True
+            if self._catch_up():
+                self._changed()
+                return True
+            return False
+
+    def records(self):
+        with self.lock:
+            self.refresh()
+            return list(self._records)
+
+    def changed_since(self, version):
+        """Return (current version, [(position, record)]) for records changed after `version`.
+
+        A reload after another process compacted the store marks every record as changed.
+        """
+        with self.lock:
+            self.refresh()
+            changed = [
+                (position, self._records[position])
+                for position, stamp in enumerate(self._stamps)
+                if stamp > version
+            ]
+            return self.version, changed
+
+    def get(self, key_value):
+        with self.lock:
+            self.refresh()
+            position = self._index.get(key_value)
+            return None if position is None else self._records[position]
+
+    def to_json(self):
+        """The collection serialized as the JSON list clients expect, cached per version"""
+        with self.lock:
+            self.refresh()
+            if self._serialized is None:
+                self._serialized = json.dumps(self._records, indent=2).encode()
+            return self._serialized
+
+    def _write(self, position, record):
+        with self.lock:
+            line = json.dumps({"pos": position, "record": record}, separators=(",", ":")) + "\n"
+            with open(self.journal_path, "ab") as journal:
+                # Drop any torn line a crashed writer left behind
+                journal.truncate(self._offset)
+                journal.write(line.encode())
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._offset += len(line.encode())
+            self._entries += 1
+            self._apply({"pos": position, "record": record})
+            self._changed()
+            if self._entries >= self.compact_every:
+                self.compact()
+
+    def append(self, record):
+        """Add a record at the end of the collection and return its position"""
+        with self.lock:
+            self.refresh()
+            position = len(self._records)
+            self._write(position, record)
+            return position
+
+    def update(self, position, record):
+        """Replace the record at `position`"""
+        with self.lock:
+            self.refresh()
+            if not 0 <= position < len(self._records):
+                raise IndexError(f"No record at position {position}")
+            self._write(position, record)
+
+    def compact(self):
+        """Fold the journal into the snapshot, which is replaced atomically"""
+        with self.lock:
+            self.refresh()
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(self._records, file, indent=2)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.path)
+            # Entries are position-addressed, so a crash before this truncate only replays them
+            with open(self.journal_path, "wb"):
+                pass
+            self._snapshot_mtime = os.stat(self.path).st_mtime_ns
+            self._offset = 0
+            self._entries = 0
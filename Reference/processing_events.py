@@ -0,0 +1,64 @@
+"""Image-processing completion notifications from image_handler.py to the server.
+
+reference.py runs the image handler's watcher in-process, and the notifier
+delivers straight to the server's ProcessingEvents. The server keeps the
+outcome of recent records, which lets a client that asks after the fact be
+answered immediately, and long-poll requests wait on a condition until their
+record is done. When image_handler.py runs on its own there is no server to
+tell, and notifications are dropped.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ProcessingEvents:
+    """Server-side record of which records are being processed and how they ended"""
+
+    def __init__(self, history=1024):
+        self.history = history
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._results = OrderedDict()
+
+    def mark_pending(self, collection, record_id):
+        key = (collection, str(record_id))
+        with self._cond:
+            self._results.pop(key, None)
+            self._pending.add(key)
+
+    def complete(self, collection, record_id, result):
+        key = (collection, str(record_id))
+        with self._cond:
+            self._pending.discard(key)
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.history:
+                self._results.popitem(last=False)
+            self._cond.notify_all()
+
+    def is_idle(self):
+        with self._cond:
+            return not self._pending
+
+    def wait(self, collection, record_id, timeout):
+        """Block until the record is done; returns its result, or None on timeout"""
+        key = (collection, str(record_id))
+        with self._cond:
+            self._cond.wait_for(lambda: key in self._results, timeout)
+            return self._results.get(key)
+
+
+class ProcessingNotifier:
+    """Image-handler side of the channel.
+
+    reference.py sets `events` to the server's ProcessingEvents; until then
+    notifications are dropped.
+    """
+
+    def __init__(self):
+        self.events = None
+
+    def notify(self, collection, record_id, status, **details):
+        if self.events is not None:
+            message = {"collection": collection, "id": record_id, "status": status, **details}
+            self.events.complete(collection, record_id, message)
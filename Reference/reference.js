@@ -177,7 +177,7 @@ async function fetchIngredientsForCocktail(searchTerm = "") {
         });
         const img = document.createElement("img");
 
-        img.src = ingredient.ING_IMG || "img/ing2.gif";
+        img.src = ingredient.ING_THUMB || ingredient.ING_IMG || "img/ing2.gif";
         img.alt = `Ingredient - ${ingredient.ING_Name}`;
         const para = document.createElement("p");
         para.textContent = ingredient.ING_Name;
@@ -843,7 +843,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
         if (response.ok) {
           // Wait for image processing to complete
-          await waitForImageProcessing();
+          await waitForImageProcessing("ingredient", ingredientId);
 
           // Hide loading screen
           document.getElementById("loading-page").style.display = "none";
@@ -957,7 +957,7 @@ async function fetchIngredients(searchTerm = "") {
 
         const imgSrc =
           ingredient.ING_IMG && ingredient.ING_IMG.trim() !== ""
-            ? ingredient.ING_IMG
+            ? ingredient.ING_THUMB || ingredient.ING_IMG
             : "img/ing2.gif";
         const img = document.createElement("img");
         img.src = imgSrc;
@@ -1227,7 +1227,7 @@ function displayCocktails(cocktails) {
     cocktailItem.id = `cocktail-${cocktail.PID}`; // Set the ID for each cocktail item
 
     cocktailItem.innerHTML = `
-          <img src="${cocktail.PImage}" alt="${cocktail.PName}" />
+          <img src="${cocktail.PThumb || cocktail.PImage}" alt="${cocktail.PName}" />
           <p>${cocktail.PName}</p>
       `;
 
@@ -1386,7 +1386,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
           if (response.ok) {
             // Wait for image processing to complete
-            await waitForImageProcessing();
+            await waitForImageProcessing("product", parseInt(cocktailId));
 
             // Hide loading screen
             document.getElementById("loading-page").style.display = "none";
@@ -1469,24 +1469,27 @@ async function updateNextCocktailId() {
   }
 }
 
-async function waitForImageProcessing() {
-  const maxAttempts = 30; // Maximum number of attempts (30 * 500ms = 15 seconds max)
-  let attempts = 0;
+async function waitForImageProcessing(collection, id) {
+  // The server holds each request open until the record is processed
+  const deadline = Date.now() + 15000; // 15 seconds max
 
-  while (attempts < maxAttempts) {
+  while (Date.now() < deadline) {
+    const timeout = Math.ceil((deadline - Date.now()) / 1000);
     try {
-      const response = await fetch("processing_complete");
-      if (response.ok) {
-        // Delete the flag file after successful check
-        await fetch("/delete_processing_flag", { method: "POST" });
-        return true;
+      const response = await fetch(
+        `/processing?collection=${collection}&id=${encodeURIComponent(id)}&timeout=${timeout}`
+      );
+      if (response.status === 200) {
+        const result = await response.json();
+        return result.status === "done";
+      }
+      if (response.status !== 202) {
+        break;
       }
     } catch (error) {
       console.log("Waiting for image processing to complete...");
+      await new Promise((resolve) => setTimeout(resolve, 500)); // Server unreachable, back off
     }
-
-    await new Promise((resolve) => setTimeout(resolve, 500)); // Wait 500ms before next attempt
-    attempts++;
   }
 
   console.warn("Image processing timed out");
@@ -4,17 +4,125 @@ import os
 import platform
 import subprocess
 import threading
-import time
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 import serial
 import serial.tools.list_ports
 
-from image_handler import processing_complete
+import image_handler
+from image_handler import ingredient_store, product_store
+from processing_events import ProcessingEvents
 
 # Define the base directory as the directory where this script is located
 base_dir = os.path.dirname(__file__)
 web_dir = os.path.join(base_dir, "static")  # Define `static` folder path
 
+# Devices the dispenser controller shows up as
+SERIAL_CANDIDATES = ("/dev/ttyACM0", "/dev/ttyUSB0")
+
+
+class SerialConnectionManager:
+    """Keeps dispenser serial connections open between requests.
+
+    Opening the port resets most boards, so connections are opened once per
+    device path and reused. Each device has its own lock, a health check before
+    every use and a single reconnect attempt when a write fails.
+    """
+
+    def __init__(self, baudrate=9600, timeout=5, candidates=SERIAL_CANDIDATES):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.candidates = candidates
+        self._connections = {}
+        self._port_locks = {}
+        self._lock = threading.Lock()  # Guards the two dicts above
+
+    def find_port(self):
+        # An already open candidate needs no lookup at all
+        with self._lock:
+            for port in self.candidates:
+                connection = self._connections.get(port)
+                if connection is not None and connection.is_open:
+                    return port
+
+        # Checking the device nodes is much cheaper than enumerating every port
+        for port in self.candidates:
+            if os.path.exists(port):
+                return port
+
+        for p in serial.tools.list_ports.comports():
+            if p.device in self.candidates:
+                return p.device
+        return None
+
+    def _port_lock(self, port):
+        with self._lock:
+            return self._port_locks.setdefault(port, threading.Lock())
+
+    def _is_healthy(self, connection):
+        try:
+            # Raises once the device has been unplugged
+            connection.in_waiting
+            return connection.is_open
+        except (serial.SerialException, OSError):
+            return False
+
+    def _connect(self, port):
+        with self._lock:
+            connection = self._connections.pop(port, None)
+        if connection is not None:
+            if self._is_healthy(connection):
+                with self._lock:
+                    self._connections[port] = connection
+                return connection
+            print(f"Serial connection to {port} lost, reconnecting")
+            try:
+                connection.close()
+            except (serial.SerialException, OSError):
+                pass
+
+        connection = serial.Serial(port, self.baudrate, timeout=self.timeout)
+        print(f"Opened serial connection to {port}")
+        with self._lock:
+            self._connections[port] = connection
+        return connection
+
+    def write(self, port, data):
+        """Write `data` to `port` in one call, reconnecting once on failure"""
+        with self._port_lock(port):
+            connection = self._connect(port)
+            try:
+                connection.write(data)
+            except (serial.SerialException, OSError) as e:
+                print(f"Write to {port} failed ({e}), retrying on a new connection")
+                self._discard(port)
+                self._connect(port).write(data)
+
+    def _discard(self, port):
+        with self._lock:
+            connection = self._connections.pop(port, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except (serial.SerialException, OSError):
+                pass
+
+    def close_all(self):
+        with self._lock:
+            ports = list(self._connections)
+        for port in ports:
+            with self._port_lock(port):
+                self._discard(port)
+
+
+serial_connections = SerialConnectionManager()
+
+# Completion of image processing, reported by the in-process image watcher
+processing_events = ProcessingEvents()
+
+# Longest a /processing request is held open
+MAX_PROCESSING_WAIT = 30
+
 
 class CustomHandler(SimpleHTTPRequestHandler):
     def translate_path(self, path):
@@ -34,25 +142,33 @@ class CustomHandler(SimpleHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Origin", "*")
 
     def do_GET(self):
-        if self.path == "processing_complete":
-            try:
-                # Check if processing is complete by checking the event
-                if processing_complete.is_set():
-                    self.send_response(200)
-                    self.send_no_cache_headers()
-                    self.end_headers()
-                else:
-                    self.send_response(404)
-                    self.send_no_cache_headers()
-                    self.end_headers()
-            except Exception as e:
-                self.send_response(500)
-                self.send_no_cache_headers()
-                self.end_headers()
-                self.wfile.write(str(e).encode())
+        url = urlparse(self.path)
+        if url.path == "/processing":
+            self.wait_for_processing(parse_qs(url.query))
             return
 
-        # For db.json and image requests, prevent caching
+        if url.path == "/processing_complete":
+            # Kept for older clients: 200 once nothing is being processed
+            self.send_response(200 if processing_events.is_idle() else 404)
+            self.send_no_cache_headers()
+            self.end_headers()
+            return
+
+        # The collections live in an append-only store; serve its current view
+        store = {"/db.json": ingredient_store, "/products.json": product_store}.get(
+            self.path.split("?")[0]
+        )
+        if store is not None:
+            content = store.to_json()
+            self.send_response(200)
+            self.send_no_cache_headers()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+
+        # For other JSON and image requests, prevent caching
         if (
             self.path.endswith(".json")
             or self.path.endswith(".png")
@@ -70,17 +186,6 @@ class CustomHandler(SimpleHTTPRequestHandler):
         super().do_GET()
 
     def do_POST(self):
-        if self.path == "/delete_processing_flag":
-            try:
-                processing_complete.clear()
-                self.send_response(200)
-                self.end_headers()
-            except Exception as e:
-                self.send_response(500)
-                self.end_headers()
-                self.wfile.write(str(e).encode())
-            return
-
         content_length = int(self.headers["Content-Length"])
         post_data = self.rfile.read(content_length)
 
@@ -120,6 +225,7 @@ class CustomHandler(SimpleHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b"Server shutting down...")
             print("Shutting down the server...")
+            serial_connections.close_all()
             httpd.shutdown()  # Graceful shutdown of the server
             os._exit(0)
 
@@ -140,6 +246,33 @@ class CustomHandler(SimpleHTTPRequestHandler):
             self.send_response(404)
             self.end_headers()
 
+    def wait_for_processing(self, query):
+        """Long-poll until the image handler has processed one record"""
+        try:
+            collection = query["collection"][0]
+            record_id = query["id"][0]
+            timeout = min(float(query.get("timeout", [MAX_PROCESSING_WAIT])[0]), MAX_PROCESSING_WAIT)
+        except (KeyError, ValueError):
+            self.send_response(400)
+            self.send_no_cache_headers()
+            self.end_headers()
+            self.wfile.write(b"collection and id are required")
+            return
+
+        result = processing_events.wait(collection, record_id, timeout)
+        if result is None:
+            # Still processing; the client asks again
+            self.send_response(202)
+            result = {"collection": collection, "id": record_id, "status": "pending"}
+        else:
+            self.send_response(200)
+        content = json.dumps(result).encode()
+        self.send_no_cache_headers()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
     def execute_shell_script(self, script_name):
         # Run scripts from the same directory as the Python script
         script_path = os.path.join(base_dir, script_name)
@@ -170,32 +303,15 @@ class CustomHandler(SimpleHTTPRequestHandler):
             
     def add_cocktail(self, post_data):
         try:
-            products_path = os.path.join(web_dir, "products.json")
             print("Starting to add cocktail")
-            if not os.path.exists(products_path):
-                print(f"products.json not found at {products_path}")
-                self.send_response(500)
-                self.end_headers()
-                self.wfile.write(b"Error: products.json file not found")
-                return
-
-            # Load existing cocktails from products.json
-            with open(products_path, "r") as file:
-                file_content = file.read()
-                if not file_content:
-                    cocktails = []
-                else:
-                    cocktails = json.loads(file_content)
 
             # Parse the new cocktail data
             new_cocktail = json.loads(post_data)
+            processing_events.mark_pending("product", new_cocktail.get("PID"))
 
-            # Append the new cocktail to the existing data
-            cocktails.append(new_cocktail)
-
-            # Write the updated data back to products.json
-            with open(os.path.join(web_dir, "products.json"), "w") as file:
-                json.dump(cocktails, file, indent=2)
+            # One journal line instead of rewriting products.json
+            product_store.append(new_cocktail)
+            image_watcher.schedule(product_store, "product")
 
             # Send success response immediately after saving JSON
             self.send_response(201)
@@ -224,38 +340,14 @@ class CustomHandler(SimpleHTTPRequestHandler):
                 self.wfile.write(b"Invalid ingredient data format")
                 return
 
-            # Load existing ingredients from db.json
-            db_path = os.path.join(web_dir, "db.json")
-            if not os.path.exists(db_path):
-                print(f"db.json not found at {db_path}")
-                self.send_response(500)
-                self.end_headers()
-                self.wfile.write(b"Error: db.json file not found")
-                return
-
-            with open(db_path, "r") as file:
-                file_content = file.read()
-                if not file_content:
-                    data = []
-                else:
-                    data = json.loads(file_content)
-
-            # Parse the new ingredient data
-            new_ingredient = json.loads(post_data)
-
-            # Append the new ingredient to the existing data
-            if not isinstance(data, list):
-                data = []
-            data.append(new_ingredient)
+            processing_events.mark_pending("ingredient", new_ingredient.get("ING_ID"))
+            # One journal line instead of rewriting db.json
+            ingredient_store.append(new_ingredient)
+            image_watcher.schedule(ingredient_store, "ingredient")
 
-            # Write the updated data back to db.json
-            with open(os.path.join(web_dir, "db.json"), "w") as file:
-                json.dump(data, file, indent=2)
-
-                # Wait for image processing to complete (with timeout)
-                self.send_response(201)
-                self.end_headers()
-                self.wfile.write(b"Ingredient added successfully")
+            self.send_response(201)
+            self.end_headers()
+            self.wfile.write(b"Ingredient added successfully")
 
         except Exception as e:
             print(f"Error adding ingredient: {e}")  # Log the error to the console
@@ -285,27 +377,22 @@ class CustomHandler(SimpleHTTPRequestHandler):
 
     def send_to_serial_output(self, assigned_pipes):
         # Find the appropriate serial port
-        port = None
-        available_ports = serial.tools.list_ports.comports()
-
-        # Check for available ports and set the appropriate one
-        for p in available_ports:
-            if p.device == "/dev/ttyACM0" or p.device == "/dev/ttyUSB0":
-                port = p.device
-                break  # Exit the loop once we find a suitable port
+        port = serial_connections.find_port()
 
         if port is None:
             print("No suitable serial port found.")
             return "Error: No suitable serial port found"
 
         try:
-            with serial.Serial(port, 9600, timeout=5) as ser:
-                for ingredient, pipe in assigned_pipes.items():
-                    message = f"{ingredient}: {pipe}\n"
-                    print(f"Sending to serial: {message.strip()}")
-                    ser.write(message.encode("utf-8"))
-
-                return "OK"  # Indicate successful sending
+            # Build the whole assignment first so it goes out in a single write
+            lines = []
+            for ingredient, pipe in assigned_pipes.items():
+                message = f"{ingredient}: {pipe}\n"
+                print(f"Sending to serial: {message.strip()}")
+                lines.append(message)
+            serial_connections.write(port, "".join(lines).encode("utf-8"))
+
+            return "OK"  # Indicate successful sending
         except serial.SerialException as e:
             error_message = f"Serial error: {str(e)}"
             print(error_message)
@@ -316,15 +403,59 @@ class CustomHandler(SimpleHTTPRequestHandler):
             return error_message  # Return the error message for the frontend
 
 
-def start_http_server():
+def create_http_server():
     global httpd
-    httpd = HTTPServer(("127.0.0.1", 5000), CustomHandler)
+    # Threaded so a slow serial write does not hold up static files and other requests
+    httpd = ThreadingHTTPServer(("127.0.0.1", 5000), CustomHandler)
     print("HTTP server running on http://127.0.0.1:5000")
-    httpd.serve_forever()
+    return httpd
+
+
+class ImageWatcher:
+    """Runs the image handler's watcher in this process and restarts it if it dies"""
+
+    def __init__(self, max_restarts=5):
+        self.max_restarts = max_restarts
+        self.stopping = threading.Event()
+        self.observer = None
+        # One handler across restarts keeps its record of what is already processed
+        self.event_handler = image_handler.JsonChangeHandler()
+        image_handler.notifier.events = processing_events
+
+    def start(self):
+        threading.Thread(target=self.supervise, name="image-watcher", daemon=True).start()
+
+    def supervise(self):
+        restarts = 0
+        while not self.stopping.is_set():
+            self.observer = image_handler.create_observer(self.event_handler)
+            try:
+                self.observer.start()
+                print("Watching for changes in db.json...")
+                self.observer.join()  # Blocks until the observer stops or dies
+            except Exception as e:
+                print(f"Image watcher failed: {e}")
+            if self.stopping.is_set() or restarts >= self.max_restarts:
+                return
+            restarts += 1
+            print(f"Image watcher stopped unexpectedly, restarting ({restarts}/{self.max_restarts})")
+            self.stopping.wait(1)
+
+    def schedule(self, store, type_):
+        """Queue records the server appended; the watcher skips this process's own writes"""
+        self.event_handler.schedule(store, type_)
+
+    def stop(self):
+        self.stopping.set()
+        if self.observer is not None:
+            self.observer.stop()
+
+
+# Created at import so request handlers can queue work; started from __main__
+image_watcher = ImageWatcher()
 
 
 def start_electron_app():
-    time.sleep(2)
     os.environ["DISPLAY"] = ":0"
 
     # Define the base path to check for "karan" or "LOQ"
@@ -362,18 +493,23 @@ def start_electron_app():
         ]
     )
     electron_process.communicate()
-
-def start_image_handler():
-    """Start the image handler script in a separate thread."""
-    subprocess.Popen(["python", os.path.join(base_dir, "image_handler.py")])
-
+    return True
 
 if __name__ == "__main__":
-    # Start the HTTP server in a separate thread
-    http_thread = threading.Thread(target=start_http_server)
+    # Bound before anything else starts, so the UI can connect immediately
+    create_http_server()
+    http_thread = threading.Thread(target=httpd.serve_forever, name="http-server", daemon=True)
     http_thread.start()
 
-    start_image_handler()
-
-    # Start the Electron app after a slight delay to ensure the server is up
-    start_electron_app()
+    image_watcher.start()
+
+    try:
+        # Blocks until the UI window is closed; without a UI keep serving until /shutdown
+        if not start_electron_app():
+            http_thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        image_watcher.stop()
+        httpd.shutdown()
+        serial_connections.close_all()
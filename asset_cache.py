@@ -0,0 +1,131 @@
+"""In-memory cache of static UI assets with ETags and precompressed variants.
+
+Each cached file is held once as raw bytes plus gzip (and brotli, when the
+`brotli` package is installed) encodings computed at load time. Entries are
+validated against the file's mtime and size on every lookup, so edits on disk
+are picked up by the next request without any watcher. The cache holds at most
+`max_bytes` across all variants, evicting the least recently used files, and
+forgets files that have been deleted.
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional
+    brotli = None
+
+CONTENT_TYPES = {
+    '.html': 'text/html',
+    '.js': 'application/javascript',
+    '.css': 'text/css',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.ico': 'image/x-icon',
+    '.flog': 'application/octet-stream'
+}
+
+# Already-compressed formats gain nothing from gzip
+COMPRESSIBLE_TYPES = {'text/html', 'application/javascript', 'text/css', 'application/json', 'image/svg+xml'}
+
+class CachedAsset:
+    def __init__(self, path, stat, body):
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.encodings = {}
+        if self.content_type in COMPRESSIBLE_TYPES:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.encodings['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body)
+                if len(compressed) < len(body):
+                    self.encodings['br'] = compressed
+
+    @property
+    def memory(self):
+        return len(self.body) + sum(len(variant) for variant in self.encodings.values())
+
+    def is_current(self, stat):
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    def negotiate(self, accept_encoding):
+        """Pick the smallest variant the client accepts: (encoding or None, body)"""
+        accepted = {token.split(';')[0].strip() for token in (accept_encoding or '').split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.encodings:
+                return encoding, self.encodings[encoding]
+        return None, self.body
+
+class AssetCache:
+    """Path-keyed LRU cache of files up to `max_file_size` bytes, `max_bytes` in total"""
+    def __init__(self, max_file_size=1024 * 1024, max_bytes=32 * 1024 * 1024):
+        self.max_file_size = max_file_size
+        self.max_bytes = max_bytes
+        self._assets = OrderedDict()  # path -> CachedAsset, least recently used first
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, path):
+        """Return the CachedAsset for `path`, or None if it is too large to cache.
+
+        Raises FileNotFoundError like open() would.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            raise
+        if stat.st_size > self.max_file_size:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset is not None and asset.is_current(stat):
+                self._assets.move_to_end(path)
+                return asset
+
+        with open(path, 'rb') as f:
+            # Stat before reading so a write during the read is caught on the next lookup
+            stat = os.fstat(f.fileno())
+            body = f.read()
+        asset = CachedAsset(path, stat, body)
+        with self._lock:
+            self._remove(path)
+            self._assets[path] = asset
+            self._size += asset.memory
+            while self._size > self.max_bytes and len(self._assets) > 1:
+                self._size -= self._assets.popitem(last=False)[1].memory
+        return asset
+
+    def _remove(self, path):
+        asset = self._assets.pop(path, None)
+        if asset is not None:
+            self._size -= asset.memory
+
+    def preload(self, paths):
+        for path in paths:
+            try:
+                self.get(path)
+            except OSError:
+                pass
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._assets.clear()
+                self._size = 0
+            else:
+                self._remove(path)
@@ -0,0 +1,143 @@
+"""Benchmark the ground-station HTTP server against the simulated GCS.
+
+Runs concurrent /send_command clients over keep-alive connections while one
+client consumes /telemetry/stream, then reports command latency percentiles
+and telemetry throughput. Without --url the server runs in-process on a free
+port; with --url an already running run_app.py is measured instead.
+
+    python benchmark.py --drones 8 --rate 20 --clients 4 --requests 500
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+COMMANDS = ('ARM', 'MODE 2', 'MODE 3', 'POSHOLD', 'DISARM')
+
+def percentile(samples, fraction):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def post_json(connection, path, payload):
+    # Bytes, so http.client sends headers and body in a single segment
+    body = json.dumps(payload).encode()
+    connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read() or b'{}')
+
+def run_clients(host, port, args):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def client(index):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        local, local_statuses = [], {}
+        for sequence in range(args.requests):
+            payload = {
+                "command": COMMANDS[(index + sequence) % len(COMMANDS)],
+                "drone_id": 1 + (index + sequence) % args.drones,
+                "await_ack": args.await_ack,
+            }
+            started = time.perf_counter()
+            status, result = post_json(connection, '/send_command', payload)
+            local.append(time.perf_counter() - started)
+            key = result.get('status', f"http {status}")
+            local_statuses[key] = local_statuses.get(key, 0) + 1
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            for key, count in local_statuses.items():
+                statuses[key] = statuses.get(key, 0) + count
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+def count_stream_frames(host, port, stop_event, result):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    connection.request('GET', '/telemetry/stream')
+    response = connection.getresponse()
+    frames = 0
+    started = time.perf_counter()
+    while not stop_event.is_set():
+        line = response.fp.readline()
+        if not line:
+            break
+        if line.startswith(b'data:'):
+            frames += 1
+    result['frames'] = frames
+    result['elapsed'] = time.perf_counter() - started
+    connection.close()
+
+def start_local_server():
+    from run_app import DroneSerialHandler, PooledHTTPServer
+
+    server = PooledHTTPServer(('127.0.0.1', 0), DroneSerialHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ground-station server")
+    parser.add_argument('--url', help="server to measure (default: start one in-process)")
+    parser.add_argument('--drones', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=10.0, help="telemetry Hz per drone")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help="commands per client")
+    parser.add_argument('--await-ack', action='store_true', help="wait for drone acknowledgement")
+    parser.add_argument('--binary', action='store_true', help="use framed binary serial mode")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        server = start_local_server()
+        host, port = server.server_address
+
+    control = http.client.HTTPConnection(host, port, timeout=30)
+    status, result = post_json(control, '/connect', {
+        "port": f"sim:drones={args.drones}&rate={args.rate}",
+        "binary": args.binary,
+    })
+    if status != 200:
+        raise SystemExit(f"Could not connect to the simulated GCS: {result}")
+
+    stop_event = threading.Event()
+    stream = {}
+    stream_thread = threading.Thread(target=count_stream_frames, args=(host, port, stop_event, stream))
+    stream_thread.daemon = True
+    stream_thread.start()
+
+    latencies, statuses, elapsed = run_clients(host, port, args)
+    stop_event.set()
+    stream_thread.join(timeout=5)
+
+    total = len(latencies)
+    print(f"Commands:  {total} in {elapsed:.2f} s ({total / elapsed:.0f}/s) from {args.clients} client(s)")
+    print("Latency:   " + "  ".join(
+        f"p{int(fraction * 100)}={percentile(latencies, fraction) * 1000:.2f} ms"
+        for fraction in (0.5, 0.9, 0.99)
+    ) + f"  max={max(latencies) * 1000:.2f} ms")
+    print(f"Statuses:  {statuses}")
+    if stream.get('elapsed'):
+        offered = args.drones * args.rate
+        print(f"Telemetry: {stream['frames'] / stream['elapsed']:.1f} frames/s on the stream "
+              f"({offered:.0f}/s periodic plus command replies)")
+
+    if server:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
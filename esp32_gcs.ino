@@ -2,6 +2,11 @@
 #include <WiFi.h>
 #include "protocol.h"
 
+// Set to 1 to exchange framed structs with the PC instead of text lines
+// (see protocol.py; connect with {"binary": true})
+#define BINARY_SERIAL 0
+const uint8_t SYNC_BYTES[2] = {0xAA, 0x55};
+
 // MAC Address of drone ESP32
 uint8_t droneAddress[] = {0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF}; // Replace with actual MAC
 
@@ -16,6 +21,18 @@ void OnDataRecv(const uint8_t *mac, const uint8_t *incomingData, int len) {
     if (len == sizeof(DroneTelemetry)) {
         DroneTelemetry telemetry;
         memcpy(&telemetry, incomingData, sizeof(DroneTelemetry));
+
+#if BINARY_SERIAL
+        // Frame: sync bytes, raw struct, additive checksum of the struct
+        uint8_t checksum = 0;
+        for (size_t i = 0; i < sizeof(DroneTelemetry); i++) {
+            checksum += incomingData[i];
+        }
+        Serial.write(SYNC_BYTES, sizeof(SYNC_BYTES));
+        Serial.write(incomingData, sizeof(DroneTelemetry));
+        Serial.write(checksum);
+        return;
+#endif
         
         // Send telemetry to PC via Serial
         Serial.print("T,"); // Telemetry identifier
@@ -53,10 +70,11 @@ void setup() {
     }
 }
 
-void sendCommand(CommandType cmd, uint8_t *payload = nullptr) {
+void sendCommand(CommandType cmd, uint8_t *payload = nullptr, uint8_t droneId = 0x01) {
     DroneMessage msg;
     msg.messageType = cmd;
-    msg.droneId = 0x01; // Default drone ID
+    msg.droneId = droneId;
+    memset(msg.payload, 0, sizeof(msg.payload));
     
     if (payload) {
         memcpy(msg.payload, payload, 6);
@@ -71,29 +89,62 @@ void sendCommand(CommandType cmd, uint8_t *payload = nullptr) {
     esp_err_t result = esp_now_send(droneAddress, (uint8_t *)&msg, sizeof(DroneMessage));
 }
 
+#if BINARY_SERIAL
+void loop() {
+    // Frame: sync bytes followed by a complete DroneMessage
+    static uint8_t frame[sizeof(DroneMessage)];
+    static size_t received = 0;
+    static uint8_t synced = 0;
+
+    while (Serial.available()) {
+        uint8_t byte = Serial.read();
+        if (synced < sizeof(SYNC_BYTES)) {
+            synced = (byte == SYNC_BYTES[synced]) ? synced + 1 : (byte == SYNC_BYTES[0]);
+            continue;
+        }
+
+        frame[received++] = byte;
+        if (received == sizeof(DroneMessage)) {
+            // The drone verifies the checksum, so the message is forwarded as-is
+            esp_now_send(droneAddress, frame, sizeof(DroneMessage));
+            received = 0;
+            synced = 0;
+        }
+    }
+}
+#else
 void loop() {
     if (Serial.available()) {
         String cmd = Serial.readStringUntil('\n');
+
+        // Optional "<droneId>:" prefix selects the target drone
+        uint8_t droneId = 0x01;
+        int separator = cmd.indexOf(':');
+        if (separator > 0) {
+            droneId = cmd.substring(0, separator).toInt();
+            cmd = cmd.substring(separator + 1);
+        }
         
         if (cmd == "ARM") {
-            sendCommand(CMD_ARM);
+            sendCommand(CMD_ARM, nullptr, droneId);
         }
         else if (cmd == "DISARM") {
-            sendCommand(CMD_DISARM);
+            sendCommand(CMD_DISARM, nullptr, droneId);
         }
         else if (cmd == "TAKEOFF") {
-            sendCommand(CMD_TAKEOFF);
+            sendCommand(CMD_TAKEOFF, nullptr, droneId);
         }
         else if (cmd == "LAND") {
-            sendCommand(CMD_LAND);
+            sendCommand(CMD_LAND, nullptr, droneId);
         }
         else if (cmd == "POSHOLD") {
-            sendCommand(CMD_POSHOLD);
+            sendCommand(CMD_POSHOLD, nullptr, droneId);
         }
         else if (cmd.startsWith("MODE")) {
             uint8_t mode = cmd.substring(5).toInt();
             uint8_t payload[6] = {mode};
-            sendCommand(CMD_MODE_CHANGE, payload);
+            sendCommand(CMD_MODE_CHANGE, payload, droneId);
         }
     }
-} 
\ No newline at end of file
+}
+#endif
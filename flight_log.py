@@ -0,0 +1,214 @@
+"""Binary flight log recording and memory-mapped replay of GCS serial traffic.
+
+A log starts with a short header followed by one record per chunk of serial
+traffic:
+
+    timestamp (float64) | direction (uint8) | length (uint16) | raw bytes
+
+Every INDEX_INTERVAL records the recorder also appends (timestamp, offset) to a
+`.idx` sidecar, so a replay can seek to a point in time without scanning the
+whole log. A lost or stale index is rebuilt from the log itself.
+"""
+import bisect
+import mmap
+import os
+import struct
+import time
+from threading import Lock
+
+MAGIC = b'FLOG'
+VERSION = 1
+HEADER = struct.Struct('<4sBd')        # magic, version, session start (epoch seconds)
+RECORD = struct.Struct('<dBH')         # seconds since start, direction, payload length
+INDEX_ENTRY = struct.Struct('<dQ')     # seconds since start, record offset
+INDEX_INTERVAL = 256
+MAX_CHUNK = 0xFFFF
+
+RX = 0  # Received from the GCS
+TX = 1  # Written to the GCS
+
+def index_path(path):
+    return f"{path}.idx"
+
+class FlightRecorder:
+    """Appends timestamped serial chunks to a flight log"""
+    def __init__(self, path):
+        self.path = path
+        self.started_at = time.time()
+        self._origin = time.monotonic()
+        self._lock = Lock()
+        self._records = 0
+        self.bytes_recorded = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._log = open(path, 'wb')
+        self._index = open(index_path(path), 'wb')
+        self._log.write(HEADER.pack(MAGIC, VERSION, self.started_at))
+
+    def record(self, direction, data):
+        with self._lock:
+            if self._log.closed:
+                return
+            for start in range(0, len(data), MAX_CHUNK):
+                chunk = data[start:start + MAX_CHUNK]
+                elapsed = time.monotonic() - self._origin
+                if self._records % INDEX_INTERVAL == 0:
+                    self._index.write(INDEX_ENTRY.pack(elapsed, self._log.tell()))
+                self._log.write(RECORD.pack(elapsed, direction, len(chunk)))
+                self._log.write(chunk)
+                self._records += 1
+                self.bytes_recorded += len(chunk)
+
+    def flush(self):
+        with self._lock:
+            if not self._log.closed:
+                self._log.flush()
+                self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._log.closed:
+                self._log.close()
+                self._index.close()
+
+class FlightLog:
+    """Read-only, memory-mapped view of a flight log"""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.started_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a flight log")
+        if version != VERSION:
+            raise ValueError(f"Unsupported flight log version {version}")
+        self._index_times, self._index_offsets = self._load_index()
+
+    def _load_index(self):
+        times, offsets = [], []
+        try:
+            with open(index_path(self.path), 'rb') as f:
+                for elapsed, offset in INDEX_ENTRY.iter_unpack(f.read()):
+                    if offset < len(self._map):
+                        times.append(elapsed)
+                        offsets.append(offset)
+        except (FileNotFoundError, struct.error):
+            pass
+        if not offsets:
+            # Rebuild from the log at the same density the recorder uses
+            for count, (offset, elapsed, _, _) in enumerate(self._scan(HEADER.size)):
+                if count % INDEX_INTERVAL == 0:
+                    times.append(elapsed)
+                    offsets.append(offset)
+        return times, offsets
+
+    def _scan(self, offset):
+        """Yield (offset, elapsed, direction, payload view) from `offset` onwards"""
+        size = len(self._map)
+        view = memoryview(self._map)
+        while offset + RECORD.size <= size:
+            elapsed, direction, length = RECORD.unpack_from(self._map, offset)
+            start = offset + RECORD.size
+            if start + length > size:
+                break  # Truncated final record from an interrupted recording
+            yield offset, elapsed, direction, view[start:start + length]
+            offset = start + length
+
+    def records(self, start=0.0, direction=None):
+        """Yield (elapsed, direction, payload) for records at or after `start` seconds"""
+        position = max(bisect.bisect_right(self._index_times, start) - 1, 0)
+        offset = self._index_offsets[position] if self._index_offsets else HEADER.size
+        for _, elapsed, record_direction, payload in self._scan(offset):
+            if elapsed < start or (direction is not None and record_direction != direction):
+                continue
+            yield elapsed, record_direction, payload
+
+    @property
+    def duration(self):
+        last = 0.0
+        offset = self._index_offsets[-1] if self._index_offsets else HEADER.size
+        for _, elapsed, _, _ in self._scan(offset):
+            last = elapsed
+        return last
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+class ReplayPort:
+    """Stand-in for `serial.Serial` that plays back the received side of a log.
+
+    Records are released at their original pace divided by `speed`; a speed of
+    0 replays as fast as the reader consumes them. Writes are accepted and
+    discarded, so the server can run unmodified against a recording.
+    """
+    def __init__(self, path, speed=1.0, start=0.0, timeout=0.1):
+        self.log = FlightLog(path)
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self.port = f"replay:{path}"
+        self._records = self.log.records(start, direction=RX)
+        self._pending = None
+        self._buffer = bytearray()
+        self._start = start
+        self._origin = time.monotonic()
+
+    def _due_at(self, elapsed):
+        if not self.speed:
+            return 0.0
+        return self._origin + (elapsed - self._start) / self.speed
+
+    def _fill(self):
+        """Move every record that is due into the read buffer"""
+        now = time.monotonic()
+        while True:
+            if self._pending is None:
+                self._pending = next(self._records, None)
+                if self._pending is None:
+                    return None
+            elapsed, _, payload = self._pending
+            due = self._due_at(elapsed)
+            if due > now:
+                return due
+            self._buffer.extend(payload)
+            self._pending = None
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise OSError("Replay port is closed")
+        deadline = time.monotonic() + (self.timeout or 0)
+        while not self._buffer:
+            next_due = self._fill()
+            if self._buffer:
+                break
+            now = time.monotonic()
+            if next_due is None or now >= deadline:
+                if next_due is None and not self._buffer:
+                    # End of the recording: behave like an idle port
+                    time.sleep(max(deadline - now, 0))
+                return b''
+            time.sleep(min(next_due, deadline) - now)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            # Release views into the map before unmapping it
+            self._records.close()
+            self._pending = None
+            self.log.close()
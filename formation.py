@@ -0,0 +1,122 @@
+"""Swarm formation targets computed from the leader position.
+
+Given the leader's latitude/longitude, the separation and the operating
+altitude set in the UI, `compute` returns a target position for every drone
+in one NumPy batch:
+
+  * offsets are laid out in a local east/north frame in metres, with the
+    leader's slot at the origin and the formation pointing along `heading`
+  * the offsets are converted to latitude/longitude with the WGS84 radii of
+    curvature at the leader's latitude, which is exact to well under a
+    centimetre over the few hundred metres a formation spans
+  * the spacing is checked against a fixed minimum safe distance
+
+Every pattern is laid out so that the closest drones are exactly one
+separation apart, so the spacing check needs no pairwise distances. The
+layout for a 1 m separation depends only on the pattern and drone count and
+is cached.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+PATTERNS = ('line', 'grid', 'v', 'circle')
+# Names used by the PROGRAM select in index.html
+PATTERN_ALIASES = {'square': 'grid', 'triangle': 'v'}
+
+# WGS84 ellipsoid
+SEMI_MAJOR_AXIS = 6378137.0
+ECCENTRICITY_SQUARED = 6.69437999014e-3
+
+V_ANGLE = np.radians(45.0)  # Angle of each V arm behind the leader
+# Closest two drones may be to each other, in metres; requests can only raise it
+MIN_SAFE_SEPARATION = 1.0
+# Largest formation computed per request
+MAX_DRONES = 256
+
+def resolve_pattern(pattern):
+    pattern = PATTERN_ALIASES.get(pattern, pattern)
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown formation pattern {pattern!r}, expected one of {', '.join(PATTERNS)}")
+    return pattern
+
+@lru_cache(maxsize=64)
+def unit_offsets(pattern, count):
+    """(count, 2) east/north offsets for a separation of 1 m, leader first; read-only"""
+    index = np.arange(count, dtype=np.float64)
+    if pattern == 'line':
+        # Abreast, alternating right and left of the leader
+        rank = np.ceil(index / 2)
+        side = np.where(index % 2 == 1, 1.0, -1.0)
+        offsets = np.column_stack((side * rank, np.zeros(count)))
+    elif pattern == 'grid':
+        # Rows behind the leader, who takes the front-left corner
+        columns = int(np.ceil(np.sqrt(count)))
+        offsets = np.column_stack((index % columns, -(index // columns)))
+    elif pattern == 'v':
+        # Alternating arms, each drone one separation further along its arm
+        rank = np.ceil(index / 2)
+        side = np.where(index % 2 == 1, 1.0, -1.0)
+        offsets = np.column_stack((side * rank * np.cos(V_ANGLE), -rank * np.sin(V_ANGLE)))
+    else:
+        # Evenly around a ring behind the leader, who takes its front point;
+        # neighbours are one separation apart
+        if count == 1:
+            offsets = np.zeros((1, 2))
+        else:
+            radius = 0.5 / np.sin(np.pi / count)
+            angle = 2 * np.pi * index / count
+            offsets = np.column_stack((radius * np.sin(angle), radius * (np.cos(angle) - 1)))
+    offsets.setflags(write=False)
+    return offsets
+
+def local_offsets(pattern, count, separation, heading=0.0):
+    """(count, 2) east/north offsets in metres, rotated clockwise by `heading` degrees"""
+    offsets = unit_offsets(resolve_pattern(pattern), count) * separation
+    if heading:
+        theta = np.radians(heading)
+        cos, sin = np.cos(theta), np.sin(theta)
+        # Compass heading: rotating north towards east is clockwise
+        rotation = np.array([[cos, -sin], [sin, cos]])
+        offsets = offsets @ rotation
+    return offsets
+
+def to_geodetic(latitude, longitude, offsets):
+    """Translate east/north offsets in metres to (count, 2) latitude/longitude degrees"""
+    phi = np.radians(latitude)
+    w = 1.0 - ECCENTRICITY_SQUARED * np.sin(phi) ** 2
+    meridional = SEMI_MAJOR_AXIS * (1.0 - ECCENTRICITY_SQUARED) / w ** 1.5
+    prime_vertical = SEMI_MAJOR_AXIS / np.sqrt(w)
+    result = np.empty_like(offsets)
+    result[:, 0] = latitude + np.degrees(offsets[:, 1] / meridional)
+    result[:, 1] = longitude + np.degrees(offsets[:, 0] / (prime_vertical * np.cos(phi)))
+    return result
+
+def compute(latitude, longitude, altitude, count, separation, pattern='line', heading=0.0,
+            minimum_separation=None):
+    """Targets for `count` drones as a dict ready to serialize.
+
+    The formation is reported as unsafe if any two drones would be closer than
+    `minimum_separation`, which cannot be set below MIN_SAFE_SEPARATION.
+    """
+    if count < 1:
+        raise ValueError("A formation needs at least one drone")
+    if count > MAX_DRONES:
+        raise ValueError(f"A formation can have at most {MAX_DRONES} drones")
+    if separation < 0:
+        raise ValueError("Separation cannot be negative")
+    pattern = resolve_pattern(pattern)
+    offsets = local_offsets(pattern, count, separation, heading)
+    positions = to_geodetic(latitude, longitude, offsets)
+    # Neighbours are one separation apart by construction; a lone drone has none
+    closest = separation if count > 1 else None
+    required = max(float(minimum_separation or 0), MIN_SAFE_SEPARATION)
+    return {
+        'pattern': pattern,
+        'latitude': positions[:, 0].tolist(),
+        'longitude': positions[:, 1].tolist(),
+        'altitude': altitude,
+        'offsets': offsets.tolist(),
+        'min_separation': closest,
+        'safe': closest is None or closest >= required - 1e-9,
+    }
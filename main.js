@@ -30,8 +30,8 @@ function createWindow() {
                     "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://unpkg.com; " +
                     "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com https://unpkg.com; " +
                     "font-src 'self' https://fonts.gstatic.com; " +
-                    "img-src 'self' data: https://*.tile.openstreetmap.org https://*.basemaps.cartocdn.com https://server.arcgisonline.com; " +
-                    "connect-src 'self' http://127.0.0.1:5000 https://*.tile.openstreetmap.org https://*.basemaps.cartocdn.com https://server.arcgisonline.com"
+                    "img-src 'self' data: http://127.0.0.1:5000; " +
+                    "connect-src 'self' http://127.0.0.1:5000"
                 ]
             }
         });
@@ -0,0 +1,184 @@
+"""Counters, gauges and fixed-bucket histograms rendered in Prometheus text format.
+
+Metrics are created once at import time in the modules that use them and
+registered in REGISTRY; `REGISTRY.render()` produces the /metrics response.
+Recording a value is one lock round trip (plus a bisect for histograms), so
+instrumenting hot paths like the serial reader costs next to nothing.
+
+A metric with `labels` is a family: `.labels(*values)` returns (and caches)
+the child for one combination, which is what gets recorded into.
+"""
+import bisect
+import math
+from threading import Lock
+
+# Seconds; spans sub-millisecond handlers up to serial timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = Lock()
+        if not self.label_names:
+            # Unlabelled metrics are reported as zero before their first update
+            self._children[()] = self._new_child()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def labels(self, *values):
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        if self.label_names:
+            raise ValueError(f"{self.name} has labels; record through .labels()")
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(child.samples(self.name, self.label_names, values))
+        return lines
+
+class _Value:
+    def __init__(self):
+        self._lock = Lock()
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def set_function(self, function):
+        """Read the value from `function()` at scrape time instead"""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+    def samples(self, name, label_names, values):
+        return [f"{name}{format_labels(label_names, values)} {format_value(self.get())}"]
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+class Gauge(Metric):
+    """Value that goes up and down, set directly or read from a function"""
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().inc(-amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+class _Buckets:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, label_names, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            labels = format_labels(label_names, values, [('le', format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = format_labels(label_names, values)
+        lines.append(f"{name}_sum{labels} {format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+class Histogram(Metric):
+    """Distribution over fixed bucket upper bounds"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
@@ -0,0 +1,143 @@
+"""Cached serial port discovery with hotplug notifications.
+
+`serial.tools.list_ports.comports()` walks sysfs (or the Windows registry) on
+every call. PortRegistry scans once, serves the cached list, and rescans only
+when something changes: on Linux/macOS it watches /dev for device nodes being
+created or removed (via watchdog, when installed), elsewhere it rescans on a
+background timer. Listeners see each change as an added/removed diff.
+"""
+import logging
+import os
+import queue
+from threading import Condition, Event, Thread, Timer
+
+import serial.tools.list_ports
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Fall back to periodic rescans
+    FileSystemEventHandler = object
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+# /dev entries that can be serial ports
+DEVICE_PREFIXES = ('tty', 'cu.', 'rfcomm')
+
+def describe(port):
+    return {"port": port.device, "description": port.description, "hwid": port.hwid}
+
+class _DeviceEventHandler(FileSystemEventHandler):
+    def __init__(self, registry):
+        self.registry = registry
+
+    def on_any_event(self, event):
+        if os.path.basename(event.src_path).startswith(DEVICE_PREFIXES):
+            self.registry.schedule_rescan()
+
+class PortRegistry:
+    """Serial port list that is scanned once and kept current by hotplug events"""
+    def __init__(self, scan=serial.tools.list_ports.comports, poll_interval=2.0,
+                 watched_poll_interval=30.0, settle_delay=0.3, device_dir='/dev'):
+        self._scan = scan
+        self.poll_interval = poll_interval
+        # Safety-net rescans while watching, for platforms whose /dev emits no events
+        self.watched_poll_interval = watched_poll_interval
+        # udev creates several nodes per plug event; wait for them to settle
+        self.settle_delay = settle_delay
+        self.device_dir = device_dir
+        self._ports = []
+        self.version = 0
+        self._cond = Condition()
+        self._listeners = set()
+        self._rescan_timer = None
+        self._observer = None
+        self._stop_event = Event()
+        self._started = False
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        self.rescan()
+        interval = self.poll_interval
+        if Observer is not None and os.path.isdir(self.device_dir):
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_DeviceEventHandler(self), self.device_dir, recursive=False)
+                self._observer.start()
+                interval = self.watched_poll_interval
+                logger.info(f"Watching {self.device_dir} for serial hotplug events")
+            except OSError as e:
+                logger.warning(f"Cannot watch {self.device_dir} ({e}), polling for ports instead")
+                self._observer = None
+        Thread(target=self._poll, args=(interval,), name='port-poller', daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            if self._rescan_timer:
+                self._rescan_timer.cancel()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=1.0)
+
+    def _poll(self, interval):
+        while not self._stop_event.wait(interval):
+            self.rescan()
+
+    def schedule_rescan(self):
+        """Coalesce a burst of device events into one rescan after `settle_delay`"""
+        with self._cond:
+            if self._rescan_timer and self._rescan_timer.is_alive():
+                return
+            self._rescan_timer = Timer(self.settle_delay, self.rescan)
+            self._rescan_timer.daemon = True
+            self._rescan_timer.start()
+
+    def ports(self):
+        if not self._started:
+            self.start()
+        with self._cond:
+            return list(self._ports)
+
+    def rescan(self):
+        """Scan now and notify listeners if the port list changed; returns the diff"""
+        try:
+            scanned = sorted((describe(port) for port in self._scan()), key=lambda port: port['port'])
+        except Exception as e:
+            logger.error(f"Error listing ports: {e}")
+            return None
+
+        with self._cond:
+            before = {port['port']: port for port in self._ports}
+            after = {port['port']: port for port in scanned}
+            added = [port for name, port in after.items() if name not in before]
+            removed = [port for name, port in before.items() if name not in after]
+            self._ports = scanned
+            if not added and not removed:
+                return None
+            self.version += 1
+            change = {"version": self.version, "added": added, "removed": removed, "ports": scanned}
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+
+        logger.info(f"Serial ports changed: +{[p['port'] for p in added]} -{[p['port'] for p in removed]}")
+        for listener in listeners:
+            try:
+                listener.put_nowait(change)
+            except queue.Full:
+                pass  # A stalled listener only misses intermediate diffs; `ports` is always complete
+        return change
+
+    def subscribe(self, maxsize=16):
+        listener = queue.Queue(maxsize=maxsize)
+        with self._cond:
+            self._listeners.add(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._cond:
+            self._listeners.discard(listener)
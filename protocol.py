@@ -0,0 +1,201 @@
+"""Binary codec for the DroneMessage and DroneTelemetry structs in protocol.h.
+
+Both structs are packed little-endian (ESP32 byte order), so they map directly
+onto `struct` formats. On the serial link each struct is wrapped in a frame:
+
+    SYNC (0xAA 0x55) | struct bytes | checksum
+
+DroneMessage already ends in its own checksum, so its frame adds only the sync
+bytes. DroneTelemetry has none, so its frame gets a trailing sum of its bytes.
+"""
+import struct
+from enum import IntEnum
+
+try:
+    import numpy as np
+except ImportError:  # Vectorized decoding is optional
+    np = None
+
+class CommandType(IntEnum):
+    ARM = 0x01
+    DISARM = 0x02
+    TAKEOFF = 0x03
+    LAND = 0x04
+    POSHOLD = 0x05
+    MODE_CHANGE = 0x06
+    HEARTBEAT = 0x07
+    TELEMETRY_REQUEST = 0x08
+
+class FlightMode(IntEnum):
+    STABILIZE = 0x01
+    ALTHOLD = 0x02
+    LOITER = 0x03
+    RTL = 0x04
+    AUTO = 0x05
+
+class ProtocolError(ValueError):
+    """Raised for malformed frames, bad checksums and unknown commands"""
+
+# Field order of DroneTelemetry, also used for the `T,...` text lines
+TELEMETRY_FIELDS = ('altitude', 'battery', 'gps_status', 'mode', 'armed', 'satellites')
+
+MESSAGE_STRUCT = struct.Struct('<BB6sB')      # messageType, droneId, payload[6], checksum
+TELEMETRY_STRUCT = struct.Struct('<ffBBBB')   # altitude, battery, gps, mode, arm, satellites
+PAYLOAD_SIZE = 6
+
+SYNC = b'\xaa\x55'
+MESSAGE_FRAME_SIZE = len(SYNC) + MESSAGE_STRUCT.size
+TELEMETRY_FRAME_SIZE = len(SYNC) + TELEMETRY_STRUCT.size + 1
+
+# Text commands understood by esp32_gcs.ino and their binary equivalents
+TEXT_COMMANDS = {
+    'ARM': CommandType.ARM,
+    'DISARM': CommandType.DISARM,
+    'TAKEOFF': CommandType.TAKEOFF,
+    'LAND': CommandType.LAND,
+    'POSHOLD': CommandType.POSHOLD,
+    'MODE': CommandType.MODE_CHANGE,
+    'HEARTBEAT': CommandType.HEARTBEAT,
+    'TELEMETRY': CommandType.TELEMETRY_REQUEST,
+}
+
+def checksum(data):
+    """8-bit additive checksum, as computed by sendCommand in esp32_gcs.ino"""
+    return sum(data) & 0xFF
+
+def encode_message(command, drone_id=1, payload=b''):
+    """Pack a DroneMessage, computing its checksum"""
+    if len(payload) > PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload is {len(payload)} bytes, at most {PAYLOAD_SIZE} allowed")
+    payload = bytes(payload).ljust(PAYLOAD_SIZE, b'\x00')
+    header = bytes((int(command), drone_id)) + payload
+    return header + bytes((checksum(header),))
+
+def decode_message(data):
+    """Unpack a DroneMessage, validating its checksum"""
+    if len(data) != MESSAGE_STRUCT.size:
+        raise ProtocolError(f"DroneMessage is {MESSAGE_STRUCT.size} bytes, got {len(data)}")
+    message_type, drone_id, payload, check = MESSAGE_STRUCT.unpack(data)
+    if checksum(data[:-1]) != check:
+        raise ProtocolError("DroneMessage checksum mismatch")
+    return {'command': message_type, 'drone_id': drone_id, 'payload': payload}
+
+def encode_telemetry(telemetry):
+    """Pack a telemetry dict (keys from TELEMETRY_FIELDS) into a DroneTelemetry"""
+    return TELEMETRY_STRUCT.pack(
+        telemetry['altitude'],
+        telemetry['battery'],
+        telemetry['gps_status'],
+        telemetry['mode'],
+        int(telemetry['armed']),
+        telemetry['satellites'],
+    )
+
+def decode_telemetry(data):
+    """Unpack a DroneTelemetry into a dict keyed by TELEMETRY_FIELDS"""
+    if len(data) != TELEMETRY_STRUCT.size:
+        raise ProtocolError(f"DroneTelemetry is {TELEMETRY_STRUCT.size} bytes, got {len(data)}")
+    altitude, battery, gps_status, mode, armed, satellites = TELEMETRY_STRUCT.unpack(data)
+    return {
+        'altitude': altitude,
+        'battery': battery,
+        'gps_status': gps_status,
+        'mode': mode,
+        'armed': bool(armed),
+        'satellites': satellites,
+    }
+
+def parse_text_command(text):
+    """Translate a GCS text command such as `MODE 3` into (CommandType, payload)"""
+    parts = text.strip().split()
+    if not parts or parts[0] not in TEXT_COMMANDS:
+        raise ProtocolError(f"Unknown command: {text!r}")
+    command = TEXT_COMMANDS[parts[0]]
+    try:
+        payload = bytes(int(arg) for arg in parts[1:])
+    except ValueError as e:
+        raise ProtocolError(f"Invalid command argument in {text!r}: {e}")
+    return command, payload
+
+def frame_message(message):
+    return SYNC + message
+
+def frame_telemetry(telemetry_bytes):
+    return SYNC + telemetry_bytes + bytes((checksum(telemetry_bytes),))
+
+class FrameDecoder:
+    """Incremental decoder that recovers framed structs from a byte stream.
+
+    Partial frames are kept until the rest arrives. On a checksum failure the
+    decoder skips past the sync bytes and searches for the next frame.
+    """
+    def __init__(self, frame_size=TELEMETRY_FRAME_SIZE):
+        self.frame_size = frame_size
+        self.errors = 0
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return the bodies of all complete, valid frames"""
+        self._buffer.extend(data)
+        bodies = []
+        while True:
+            start = self._buffer.find(SYNC)
+            if start < 0:
+                # Keep a trailing byte in case it is the first half of SYNC
+                del self._buffer[:max(len(self._buffer) - 1, 0)]
+                break
+            if start:
+                del self._buffer[:start]
+            if len(self._buffer) < self.frame_size:
+                break
+
+            frame = bytes(self._buffer[:self.frame_size])
+            body, check = frame[len(SYNC):-1], frame[-1]
+            if checksum(body) != check:
+                self.errors += 1
+                del self._buffer[:len(SYNC)]
+                continue
+            bodies.append(frame[len(SYNC):])
+            del self._buffer[:self.frame_size]
+        return bodies
+
+    def feed_telemetry(self, data):
+        """Decode framed DroneTelemetry structs from `data`"""
+        return [decode_telemetry(body[:-1]) for body in self.feed(data)]
+
+# NumPy view of a framed DroneTelemetry, for decoding recordings in bulk
+if np is not None:
+    TELEMETRY_DTYPE = np.dtype([
+        ('altitude', '<f4'),
+        ('battery', '<f4'),
+        ('gps_status', 'u1'),
+        ('mode', 'u1'),
+        ('armed', 'u1'),
+        ('satellites', 'u1'),
+    ])
+    TELEMETRY_FRAME_DTYPE = np.dtype([
+        ('sync', 'u1', (len(SYNC),)),
+        ('telemetry', TELEMETRY_DTYPE),
+        ('checksum', 'u1'),
+    ])
+else:
+    TELEMETRY_DTYPE = TELEMETRY_FRAME_DTYPE = None
+
+def decode_telemetry_frames(data):
+    """Decode a buffer of back-to-back telemetry frames into a structured array.
+
+    Frames with a bad sync or checksum are dropped. Use FrameDecoder for live
+    streams that may be misaligned.
+    """
+    if np is None:
+        raise RuntimeError("decode_telemetry_frames requires numpy")
+    count = len(data) // TELEMETRY_FRAME_SIZE
+    raw = np.frombuffer(data, dtype=np.uint8, count=count * TELEMETRY_FRAME_SIZE)
+    raw = raw.reshape(count, TELEMETRY_FRAME_SIZE)
+
+    sync_ok = (raw[:, 0] == SYNC[0]) & (raw[:, 1] == SYNC[1])
+    sums = raw[:, len(SYNC):-1].sum(axis=1, dtype=np.uint32) & 0xFF
+    valid = sync_ok & (sums == raw[:, -1])
+
+    frames = raw.view(TELEMETRY_FRAME_DTYPE).reshape(count)
+    return frames['telemetry'][valid]
@@ -1,100 +1,707 @@
-import subprocess
 import time
 import serial
 import json
-from threading import Thread
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Condition, Event, Lock, RLock, Thread
 from http.server import HTTPServer, SimpleHTTPRequestHandler
-import serial.tools.list_ports
+from urllib.parse import parse_qs, urlsplit
 import logging
+import math
 import os
+import re
+
+import flight_log
+from port_registry import PortRegistry
+from asset_cache import CONTENT_TYPES, AssetCache
+import protocol
+import serial_bridge
+import simulator
+from protocol import TELEMETRY_FIELDS
+from scheduler import AckTracker, CommandScheduler
+from supervisor import Supervisor
+from telemetry_store import SERIES_NAMES, TelemetryStore
+from tile_cache import TileCache, TileUnavailable
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from tracing import TRACER, SamplingProfiler
+
+try:
+    import formation
+except ImportError:  # numpy is optional; /formation reports it missing
+    formation = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Get the directory containing run_app.py
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+# Ports named `replay:<log file>` play back a recorded session instead
+REPLAY_PREFIX = 'replay:'
+# Ports named `sim:<options>` (e.g. `sim:drones=4&rate=10`) use the GCS emulator
+SIM_PREFIX = 'sim:'
+# Ports named `bridge:<address>` (e.g. `bridge:tcp:127.0.0.1:5760`) go through serial_bridge.py
+BRIDGE_PREFIX = 'bridge:'
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+TILE_DIR = os.path.join(BASE_DIR, 'tiles')
+# /tiles/<source>/<z>/<x>/<y>, with an optional extension for the map library
+TILE_PATTERN = re.compile(r'^/tiles/(\w+)/(\d+)/(\d+)/(\d+)(?:\.\w+)?$')
+
+def parse_range(header, size):
+    """Resolve a single-range `Range` header to an inclusive (start, end).
+
+    Returns None when the header should be ignored (absent or multi-range) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not header or ',' in header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the final N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'gcs_http_request_duration_seconds', "Time from request line to response sent", ('method', 'endpoint'))
+HTTP_REQUESTS = Counter('gcs_http_requests_total', "HTTP requests handled", ('method', 'endpoint', 'status'))
+SERIAL_BYTES = Counter('gcs_serial_bytes_total', "Bytes written to and read from the GCS port", ('direction',))
+TELEMETRY_FRAMES = Counter('gcs_telemetry_frames_total', "Telemetry frames parsed from the GCS port")
+PARSE_ERRORS = Counter('gcs_serial_parse_errors_total', "Malformed telemetry lines or frames", ('format',))
+SERIAL_RESPONSE_SECONDS = Histogram(
+    'gcs_serial_response_seconds', "Time until the first response line to a query command")
+SERIAL_RESPONSE_TIMEOUTS = Counter('gcs_serial_response_timeouts_total', "Query commands that got no response")
+COMMAND_RESULTS = Counter('gcs_commands_total', "Commands by status once /send_command returns", ('status',))
+SERIAL_CONNECTED = Gauge('gcs_serial_connected', "1 while a GCS port is open")
+# Endpoints reported by name; every other path is a static file
+METRIC_ENDPOINTS = {
+    '/telemetry', '/telemetry/stream', '/telemetry/history', '/ports/stream', '/list_ports', '/metrics',
+    '/connect', '/send_command', '/send_commands', '/recording/start', '/recording/stop', '/formation',
+    '/debug/trace', '/debug/tracing', '/debug/profile', '/debug/profiler/start', '/debug/profiler/stop',
+}
+
+DEFAULT_DRONE_ID = 1
+
+def parse_telemetry_line(line):
+    """Parse a `T,alt,batt,gps,mode,arm,sats` line into a telemetry dict.
+
+    An optional drone id may precede the values (`T,id,alt,...`); lines without
+    one are attributed to DEFAULT_DRONE_ID. Raises ValueError on malformed input.
+    """
+    parts = line.split(',')
+    if parts[0] != 'T':
+        raise ValueError(f"Not a telemetry line: {line!r}")
+    values = parts[1:]
+    drone_id = DEFAULT_DRONE_ID
+    if len(values) == len(TELEMETRY_FIELDS) + 1:
+        drone_id = int(values.pop(0))
+    if len(values) != len(TELEMETRY_FIELDS):
+        raise ValueError(f"Expected {len(TELEMETRY_FIELDS)} telemetry fields, got {len(values)}")
+
+    gps_status, mode, armed, satellites = (int(value) for value in values[2:])
+    # The history store keeps these as unsigned bytes, as the firmware does
+    if not all(0 <= value <= 255 for value in (gps_status, mode, armed, satellites)):
+        raise ValueError(f"Telemetry values out of range: {line!r}")
+    altitude, battery = float(values[0]), float(values[1])
+    # nan/inf would reach clients as invalid JSON
+    if not (math.isfinite(altitude) and math.isfinite(battery)):
+        raise ValueError(f"Telemetry values not finite: {line!r}")
+    return {
+        'drone_id': drone_id,
+        'altitude': altitude,
+        'battery': battery,
+        'gps_status': gps_status,
+        'mode': mode,
+        'armed': bool(armed),
+        'satellites': satellites,
+    }
+
+class TelemetrySubscriber:
+    """Per-client mailbox holding only the newest undelivered frame per drone.
+
+    The serial reader never waits on a slow client: a frame that has not been
+    picked up yet is simply replaced by the next one for the same drone.
+    """
+    def __init__(self):
+        self._pending = {}
+        self._cond = Condition()
+        self.coalesced = 0
+
+    def offer(self, frame):
+        with self._cond:
+            if frame['drone_id'] in self._pending:
+                self.coalesced += 1
+            self._pending[frame['drone_id']] = frame
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """Wait for pending frames and return them in arrival order"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending, timeout)
+            frames = sorted(self._pending.values(), key=lambda frame: frame['seq'])
+            self._pending.clear()
+            return frames
+
+class TelemetryBuffer:
+    """Bounded ring buffer of parsed telemetry frames.
+
+    Every frame gets a monotonically increasing `seq` so readers can ask for
+    everything newer than the last frame they saw without blocking the writer.
+    """
+    def __init__(self, maxlen=1024):
+        self._frames = deque(maxlen=maxlen)
+        self._seq = 0
+        self._cond = Condition()
+        self._subscribers = set()
+        self._listeners = []
+
+    def push(self, frame):
+        with self._cond:
+            self._seq += 1
+            frame['seq'] = self._seq
+            frame['timestamp'] = time.time()
+            self._frames.append(frame)
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(frame)
+        # Runs on the serial reader thread, which must outlive any faulty consumer
+        for listener in list(self._listeners):
+            try:
+                listener(frame)
+            except Exception:
+                logger.exception(f"Telemetry listener {listener!r} failed")
+
+    def add_listener(self, callback):
+        """Call `callback(frame)` on the reader thread for every pushed frame"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def subscribe(self):
+        subscriber = TelemetrySubscriber()
+        with self._cond:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def latest(self):
+        """Return the most recent frame, or None if nothing was received yet"""
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def since(self, seq):
+        """Return all buffered frames with a sequence number greater than `seq`"""
+        with self._cond:
+            # Frames are ordered by seq, so only the tail needs to be walked
+            newer = []
+            for frame in reversed(self._frames):
+                if frame['seq'] <= seq:
+                    break
+                newer.append(frame)
+            newer.reverse()
+            return newer
+
+    def wait_since(self, seq, timeout=None):
+        """Block until frames newer than `seq` arrive or `timeout` elapses"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+        return self.since(seq)
+
+    def clear(self):
+        with self._cond:
+            self._frames.clear()
+
+class SerialReader(Thread):
+    """Background thread that owns reads from the GCS serial port.
+
+    In text mode bytes are framed into lines; telemetry lines are parsed into
+    the telemetry buffer and everything else is queued as a command response.
+    In binary mode the port carries framed DroneTelemetry structs only.
+    """
+    def __init__(self, port, telemetry, binary=False, max_responses=256):
+        super().__init__(name='serial-reader', daemon=True)
+        self.port = port
+        self.telemetry = telemetry
+        self.binary = binary
+        self.decoder = protocol.FrameDecoder()
+        self.responses = queue.Queue(maxsize=max_responses)
+        # Optional FlightRecorder that receives every raw chunk read
+        self.recorder = None
+        self._line_errors = 0
+        self._stop_event = Event()
+
+    @property
+    def parse_errors(self):
+        return self._line_errors + self.decoder.errors
+
+    def run(self):
+        pending = bytearray()
+        while not self._stop_event.is_set():
+            try:
+                # Blocks for at most the port timeout, so there is no busy loop
+                chunk = self.port.read(self.port.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if not self._stop_event.is_set():
+                    logger.error(f"Serial read error: {e}")
+                break
+            if not chunk:
+                continue
+            SERIAL_BYTES.labels('rx').inc(len(chunk))
+            if self.recorder:
+                self.recorder.record(flight_log.RX, chunk)
+
+            if self.binary:
+                errors = self.decoder.errors
+                frames = self.decoder.feed_telemetry(chunk)
+                if self.decoder.errors != errors:
+                    PARSE_ERRORS.labels('binary').inc(self.decoder.errors - errors)
+                for frame in frames:
+                    if not (math.isfinite(frame['altitude']) and math.isfinite(frame['battery'])):
+                        self._line_errors += 1
+                        PARSE_ERRORS.labels('binary').inc()
+                        continue
+                    frame['drone_id'] = DEFAULT_DRONE_ID
+                    self.telemetry.push(frame)
+                    TELEMETRY_FRAMES.inc()
+                continue
+
+            pending.extend(chunk)
+            while True:
+                newline = pending.find(b'\n')
+                if newline < 0:
+                    break
+                raw = bytes(pending[:newline])
+                del pending[:newline + 1]
+                self.handle_line(raw.decode(errors='replace').strip())
+
+    def handle_line(self, line):
+        if not line:
+            return
+        if line.startswith('T,'):
+            try:
+                self.telemetry.push(parse_telemetry_line(line))
+                TELEMETRY_FRAMES.inc()
+            except ValueError as e:
+                self._line_errors += 1
+                PARSE_ERRORS.labels('text').inc()
+                logger.warning(f"Dropping malformed telemetry: {e}")
+            return
+
+        # Keep the newest responses if nobody is collecting them
+        while True:
+            try:
+                self.responses.put_nowait(line)
+                break
+            except queue.Full:
+                try:
+                    self.responses.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def clear_responses(self):
+        while True:
+            try:
+                self.responses.get_nowait()
+            except queue.Empty:
+                return
+
+    def stop(self):
+        self._stop_event.set()
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that hands connections to a bounded pool of worker threads.
+
+    Connections beyond what the pool and its queue can hold are answered with
+    503 straight away instead of piling up behind a slow serial query.
+    Long-lived event streams detach from the pool (see `start_stream`).
+    """
+    def __init__(self, server_address, handler_class, max_workers=16, max_queued=32):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-worker')
+        self._slots = BoundedSemaphore(max_workers + max_queued)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"Worker pool saturated, rejecting {client_address}")
+            try:
+                request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                                b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.executor.submit(self.process_request_worker, request, client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def process_request_worker(self, request, client_address):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            # A detached event stream closes its own connection when it ends
+            if not getattr(handler, 'detached', False):
+                self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 class DroneSerialHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 keeps UI connections open between requests
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections give their worker back after this many seconds
+    timeout = 5
+    # Headers and body go out in separate writes; without TCP_NODELAY the body
+    # waits on the client's delayed ACK (~40 ms per request)
+    disable_nagle_algorithm = True
+
     serial_port = None
+    serial_reader = None
+    scheduler = None
+    ack_tracker = None
+    recorder = None
+    binary_mode = False
+    # Serializes whole write/response transactions on the shared port
+    serial_lock = RLock()
+    # Held across a whole close-and-reopen, so concurrent /connect requests cannot interleave
+    connect_lock = RLock()
+    # One query at a time, so every non-telemetry line belongs to the query waiting for it
+    query_lock = Lock()
+    command_timeout = 2.0  # Seconds /send_command waits for a queued command to go out
+    telemetry = TelemetryBuffer()
+    history = TelemetryStore()
+    telemetry.add_listener(history.record)
+    assets = AssetCache()
+    ports = PortRegistry()
+    tiles = TileCache(TILE_DIR)
+    profiler = None  # Most recent SamplingProfiler started through /debug/profiler/start
+    stream_keepalive = 15.0  # Seconds between SSE comments on an idle stream
+    # Event streams run on their own threads outside the worker pool, up to this many
+    stream_slots = BoundedSemaphore(32)
+    detached = False
+
+    @classmethod
+    def open_serial(cls, port, baudrate, binary=False, replay_speed=1.0):
+        """Open `port` and start a reader thread on it, replacing any current connection"""
+        with cls.connect_lock:
+            cls.close_serial()
+            with cls.serial_lock:
+                # A short read timeout lets the reader thread notice stop requests
+                if port.startswith(REPLAY_PREFIX):
+                    log_path = os.path.abspath(os.path.join(LOG_DIR, port[len(REPLAY_PREFIX):]))
+                    if not log_path.startswith(LOG_DIR + os.sep):
+                        raise ValueError("Invalid replay log name")
+                    cls.serial_port = flight_log.ReplayPort(log_path, speed=replay_speed, timeout=0.1)
+                elif port.startswith(SIM_PREFIX):
+                    emulator = simulator.GCSEmulator.from_spec(port[len(SIM_PREFIX):], binary=binary)
+                    cls.serial_port = simulator.SimulatedPort(emulator, timeout=0.1)
+                elif port.startswith(BRIDGE_PREFIX):
+                    cls.serial_port = serial_bridge.BridgePort(port[len(BRIDGE_PREFIX):], timeout=0.1)
+                else:
+                    cls.serial_port = serial.Serial(port, baudrate, timeout=0.1)
+                cls.binary_mode = binary
+                cls.telemetry.clear()
+                cls.serial_reader = SerialReader(cls.serial_port, cls.telemetry, binary=binary)
+                cls.serial_reader.recorder = cls.recorder
+                cls.serial_reader.start()
+            # 8N1 framing puts ten bits on the wire per byte
+            cls.scheduler = CommandScheduler(cls.write_serial, cls.encode_command, bytes_per_second=baudrate / 10)
+            cls.ack_tracker = AckTracker()
+            cls.ack_tracker.start(cls.scheduler)
+            cls.telemetry.add_listener(cls.ack_tracker.on_telemetry)
+            cls.scheduler.start()
+
+    @classmethod
+    def is_connected(cls):
+        # A reader that died (e.g. the device was unplugged) leaves nothing receiving
+        reader_alive = cls.serial_reader is None or cls.serial_reader.is_alive()
+        return bool(cls.serial_port and cls.serial_port.is_open and reader_alive)
+
+    @classmethod
+    def write_serial(cls, data):
+        with cls.serial_lock:
+            if not cls.is_connected():
+                raise Exception("Serial port not connected")
+            with TRACER.span('serial write', 'serial', bytes=len(data)):
+                cls.serial_port.write(data)
+            SERIAL_BYTES.labels('tx').inc(len(data))
+            if cls.recorder:
+                cls.recorder.record(flight_log.TX, data)
+
+    @classmethod
+    def start_recording(cls, name=None):
+        """Record all serial traffic to `LOG_DIR/name`, replacing any running recording"""
+        cls.stop_recording()
+        name = name or time.strftime('flight-%Y%m%d-%H%M%S.flog')
+        path = os.path.abspath(os.path.join(LOG_DIR, name))
+        if not path.startswith(LOG_DIR + os.sep):
+            raise ValueError("Invalid recording name")
+        cls.recorder = flight_log.FlightRecorder(path)
+        if cls.serial_reader:
+            cls.serial_reader.recorder = cls.recorder
+        logger.info(f"Recording serial traffic to {path}")
+        return cls.recorder
+
+    @classmethod
+    def stop_recording(cls):
+        recorder = cls.recorder
+        if not recorder:
+            return None
+        cls.recorder = None
+        if cls.serial_reader:
+            cls.serial_reader.recorder = None
+        recorder.close()
+        logger.info(f"Stopped recording, {recorder.bytes_recorded} bytes in {recorder.path}")
+        return recorder
+
+    @classmethod
+    def encode_command(cls, command, drone_id=DEFAULT_DRONE_ID):
+        """Encode a text command for the wire format of the current connection"""
+        if cls.binary_mode:
+            command_type, payload = protocol.parse_text_command(command)
+            return protocol.frame_message(protocol.encode_message(command_type, drone_id, payload))
+        if drone_id != DEFAULT_DRONE_ID:
+            # esp32_gcs.ino reads an `id:` prefix as the target drone
+            return f"{drone_id}:{command}\n".encode()
+        return f"{command}\n".encode()
+
+    @classmethod
+    def close_serial(cls):
+        with cls.connect_lock:
+            # Stopped outside the lock, since its thread takes the lock to write
+            if cls.scheduler:
+                cls.scheduler.stop()
+                cls.scheduler = None
+            if cls.ack_tracker:
+                cls.telemetry.remove_listener(cls.ack_tracker.on_telemetry)
+                cls.ack_tracker.stop()
+                cls.ack_tracker = None
+            with cls.serial_lock:
+                if cls.serial_reader:
+                    cls.serial_reader.stop()
+                if cls.serial_port and cls.serial_port.is_open:
+                    cls.serial_port.close()
+                if cls.serial_reader:
+                    cls.serial_reader.join(timeout=1.0)
+                    cls.serial_reader = None
     
-    def send_cors_headers(self):
+    def parse_request(self):
+        # Called once the request line has arrived, so keep-alive idle time is not counted
+        self.request_started = time.perf_counter()
+        self.response_status = None
+        with TRACER.span('parse headers'):
+            return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def handle_one_request(self):
+        self.request_started = None
+        super().handle_one_request()
+        if self.request_started is None or not getattr(self, 'command', None):
+            return
+        path = urlsplit(self.path).path
+        if path in METRIC_ENDPOINTS:
+            endpoint = path
+        elif path.startswith('/tiles/'):
+            endpoint = '/tiles'
+        else:
+            endpoint = 'static'
+        finished = time.perf_counter()
+        HTTP_REQUEST_SECONDS.labels(self.command, endpoint).observe(finished - self.request_started)
+        HTTP_REQUESTS.labels(self.command, endpoint, self.response_status).inc()
+        TRACER.add(f"{self.command} {endpoint}", 'request', int(self.request_started * 1e6), int(finished * 1e6),
+                   {"path": self.path, "status": self.response_status})
+
+    def write_body(self, body):
+        with TRACER.span('write response', bytes=len(body)):
+            self.wfile.write(body)
+
+    def send_metrics(self):
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers()
+        self.end_headers()
+        self.write_body(body)
+
+    def send_profile(self, output):
+        """Samples of the last profiler run as Chrome trace JSON or a pstats file"""
+        profiler = DroneSerialHandler.profiler
+        if profiler is None:
+            self.send_json({"error": "The profiler has not been run"}, status=404)
+            return
+        if profiler.running:
+            self.send_json({"error": "Stop the profiler first"}, status=409)
+            return
+        if output == 'chrome':
+            self.send_json(profiler.chrome_trace())
+            return
+        if output != 'pstats':
+            self.send_json({"error": "Expected format=chrome or format=pstats"}, status=400)
+            return
+        body = profiler.dump_pstats()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Disposition', 'attachment; filename="gcs.pstats"')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers()
+        self.end_headers()
+        self.write_body(body)
+
+    def send_cors_headers(self, cache_control='no-store, no-cache, must-revalidate'):
         """Add CORS and cache control headers to response"""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.send_header('Access-Control-Max-Age', '86400')  # 24 hours
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+        self.send_header('Cache-Control', cache_control)
+
+    def send_json(self, payload, status=200):
+        """Send `payload` as a JSON response with an explicit length for keep-alive"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers()
+        self.end_headers()
+        self.write_body(body)
     
     def do_OPTIONS(self):
         """Handle preflight requests"""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.send_cors_headers()
         self.end_headers()
     
     def do_GET(self):
         # Handle API endpoints
-        if self.path == '/list_ports':
+        url = urlsplit(self.path)
+        if url.path == '/telemetry/stream':
+            self.start_stream(self.stream_telemetry)
+            return
+
+        if url.path == '/telemetry/history':
+            try:
+                query = parse_qs(url.query)
+                drone_id = int(query.get('drone_id', [DEFAULT_DRONE_ID])[0])
+                start = float(query['start'][0]) if 'start' in query else None
+                end = float(query['end'][0]) if 'end' in query else None
+                fields = query['fields'][0].split(',') if 'fields' in query else SERIES_NAMES
+
+                if 'points' in query:
+                    series = DroneSerialHandler.history.downsample(
+                        drone_id, int(query['points'][0]), start, end, fields)
+                else:
+                    series = DroneSerialHandler.history.query(drone_id, start, end, fields)
+                self.send_json({"drone_id": drone_id, "series": series})
+            except ValueError as e:
+                self.send_error(400, f"Invalid query: {e}")
+            return
+
+        if url.path == '/telemetry':
+            try:
+                query = parse_qs(url.query)
+                if 'since' in query:
+                    frames = DroneSerialHandler.telemetry.since(int(query['since'][0]))
+                else:
+                    latest = DroneSerialHandler.telemetry.latest()
+                    frames = [latest] if latest else []
+
+                self.send_json({
+                    "frames": frames,
+                    "seq": DroneSerialHandler.telemetry.last_seq
+                })
+            except ValueError as e:
+                self.send_error(400, f"Invalid query: {e}")
+            return
+
+        if url.path == '/ports/stream':
+            self.start_stream(self.stream_port_changes)
+            return
+
+        if url.path == '/metrics':
+            self.send_metrics()
+            return
+
+        if url.path == '/debug/trace':
+            self.send_json(TRACER.chrome_trace())
+            return
+
+        if url.path == '/debug/profile':
+            self.send_profile(parse_qs(url.query).get('format', ['chrome'])[0])
+            return
+
+        if url.path == '/list_ports':
             try:
-                ports = []
-                for port in serial.tools.list_ports.comports():
-                    # Include all ports without filtering
-                    ports.append({
-                        "port": port.device,
-                        "description": port.description,
-                        "hwid": port.hwid
-                    })
+                # Served from the registry; ?refresh=1 forces a rescan first
+                if parse_qs(url.query).get('refresh') == ['1']:
+                    DroneSerialHandler.ports.rescan()
+                ports = DroneSerialHandler.ports.ports()
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps(ports).encode())
-                logger.info(f"Found ports: {ports}")
+                self.send_json(ports)
+                logger.debug(f"Found ports: {ports}")
                 
             except Exception as e:
                 logger.error(f"Error listing ports: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self.send_json({"error": str(e)}, status=500)
+            return
+
+        tile = TILE_PATTERN.match(url.path)
+        if tile:
+            self.send_tile(tile.group(1), *(int(value) for value in tile.groups()[1:]))
             return
 
         # Handle static files
         try:
             # Map the requested path to the actual file path
-            if self.path == '/':
+            if url.path == '/':
                 file_path = os.path.join(BASE_DIR, 'index.html')
             else:
                 # Remove leading slash and join with base directory
-                clean_path = self.path.lstrip('/')
+                clean_path = url.path.lstrip('/')
                 file_path = os.path.join(BASE_DIR, clean_path)
 
             # Validate the path is within BASE_DIR
             if not os.path.abspath(file_path).startswith(BASE_DIR):
                 raise Exception("Invalid path")
-            
-            # Map file extensions to content types
-            content_types = {
-                '.html': 'text/html',
-                '.js': 'application/javascript',
-                '.css': 'text/css',
-                '.png': 'image/png',
-                '.jpg': 'image/jpeg',
-                '.gif': 'image/gif',
-                '.ico': 'image/x-icon'
-            }
-            
-            ext = os.path.splitext(file_path)[1]
-            
-            with open(file_path, 'rb') as f:
-                self.send_response(200)
-                if ext in content_types:
-                    self.send_header('Content-type', content_types[ext])
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(f.read())
-                logger.debug(f"Served file: {file_path}")
+
+            # Range requests and files too large to keep in memory are streamed
+            asset = None
+            if 'Range' not in self.headers:
+                with TRACER.span('asset lookup'):
+                    asset = DroneSerialHandler.assets.get(file_path)
+            if asset is not None:
+                self.send_asset(asset)
+            else:
+                self.send_file(file_path)
+            logger.debug(f"Served file: {file_path}")
                 
         except FileNotFoundError:
             logger.error(f"File not found: {self.path}")
@@ -103,12 +710,166 @@ class DroneSerialHandler(SimpleHTTPRequestHandler):
             logger.error(f"Error serving file: {e}")
             self.send_error(500, f"Server error: {str(e)}")
 
+    def send_tile(self, source, z, x, y):
+        try:
+            with TRACER.span('tile lookup'):
+                data = DroneSerialHandler.tiles.get(source, z, x, y)
+        except ValueError as e:
+            self.send_error(404, str(e))
+            return
+        except TileUnavailable as e:
+            logger.warning(str(e))
+            self.send_error(502, "Tile unavailable")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', DroneSerialHandler.tiles.content_type(source))
+        self.send_header('Content-Length', str(len(data)))
+        # Tiles rarely change; let the renderer keep them for a week
+        self.send_cors_headers('public, max-age=604800')
+        self.end_headers()
+        self.write_body(data)
+
+    def send_asset(self, asset):
+        """Send a cached asset, honouring If-None-Match and Accept-Encoding"""
+        # Clients may reuse their copy but must revalidate it every time
+        cache_control = 'no-cache'
+        if_none_match = self.headers.get('If-None-Match', '')
+        if asset.etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            self.send_response(304)
+            self.send_header('ETag', asset.etag)
+            self.send_cors_headers(cache_control)
+            self.end_headers()
+            return
+
+        encoding, body = asset.negotiate(self.headers.get('Accept-Encoding'))
+        self.send_response(200)
+        if asset.content_type:
+            self.send_header('Content-type', asset.content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if asset.encodings:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', asset.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers(cache_control)
+        self.end_headers()
+        self.write_body(body)
+
+    def send_file(self, file_path):
+        """Stream a file from disk with `sendfile`, honouring single-part Range requests"""
+        ext = os.path.splitext(file_path)[1].lower()
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            try:
+                byte_range = parse_range(self.headers.get('Range'), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.send_cors_headers()
+                self.end_headers()
+                return
+
+            start, end = byte_range if byte_range else (0, size - 1)
+            length = end - start + 1 if size else 0
+            self.send_response(206 if byte_range else 200)
+            if ext in CONTENT_TYPES:
+                self.send_header('Content-type', CONTENT_TYPES[ext])
+            self.send_header('Accept-Ranges', 'bytes')
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(length))
+            self.send_cors_headers()
+            self.end_headers()
+            if length:
+                # Kernel-side copy where supported; falls back to chunked send() otherwise
+                self.wfile.flush()
+                with TRACER.span('write response', bytes=length):
+                    self.connection.sendfile(f, start, length)
+
+    def start_stream(self, pump):
+        """Send Server-Sent Events headers and hand the connection to a daemon thread running `pump`.
+
+        A stream lasts as long as the UI window, so it must not hold one of the
+        pooled workers; streams have their own cap instead.
+        """
+        if not self.stream_slots.acquire(blocking=False):
+            self.send_error(503, "Too many open event streams")
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.send_cors_headers()
+            self.end_headers()
+        except OSError:
+            self.stream_slots.release()
+            raise
+        self.close_connection = True
+        self.detached = True
+        Thread(target=self.run_stream, args=(pump,), name='event-stream', daemon=True).start()
+
+    def run_stream(self, pump):
+        try:
+            pump()
+        except (OSError, ValueError):
+            # Client went away (or the server closed the socket under us)
+            logger.debug(f"Event stream {self.path} disconnected")
+        finally:
+            self.stream_slots.release()
+            try:
+                super().finish()
+            except OSError:
+                pass
+            self.server.shutdown_request(self.request)
+
+    def finish(self):
+        # A detached stream's thread still writes to the connection
+        if not self.detached:
+            super().finish()
+
+    def stream_port_changes(self):
+        """Push serial port hotplug diffs to the client"""
+        listener = DroneSerialHandler.ports.subscribe()
+        try:
+            while True:
+                try:
+                    change = listener.get(timeout=self.stream_keepalive)
+                    self.wfile.write(f"id: {change['version']}\ndata: {json.dumps(change)}\n\n".encode())
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+        finally:
+            DroneSerialHandler.ports.unsubscribe(listener)
+
+    def stream_telemetry(self):
+        """Push telemetry frames to the client"""
+        subscriber = DroneSerialHandler.telemetry.subscribe()
+        try:
+            # Start the client off with the current state of every drone
+            latest = DroneSerialHandler.telemetry.latest()
+            if latest:
+                subscriber.offer(latest)
+
+            while True:
+                frames = subscriber.take(timeout=self.stream_keepalive)
+                if not frames:
+                    self.wfile.write(b': keepalive\n\n')
+                else:
+                    self.wfile.write(b''.join(
+                        f"id: {frame['seq']}\ndata: {json.dumps(frame)}\n\n".encode()
+                        for frame in frames
+                    ))
+                self.wfile.flush()
+        finally:
+            DroneSerialHandler.telemetry.unsubscribe(subscriber)
+
     def do_POST(self):
         content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length)
-        
         try:
-            data = json.loads(post_data) if content_length > 0 else {}
+            with TRACER.span('parse body', bytes=content_length):
+                post_data = self.rfile.read(content_length)
+                data = json.loads(post_data) if content_length > 0 else {}
         except json.JSONDecodeError:
             self.send_error(400, "Invalid JSON")
             return
@@ -117,145 +878,264 @@ class DroneSerialHandler(SimpleHTTPRequestHandler):
             try:
                 port = data.get('port')
                 baudrate = data.get('baudrate', 115200)
+                binary = bool(data.get('binary', False))
+                # Playback rate for replay: ports, 0 meaning as fast as possible
+                speed = float(data.get('speed', 1.0))
                 
-                if DroneSerialHandler.serial_port:
-                    DroneSerialHandler.serial_port.close()
-                    
-                DroneSerialHandler.serial_port = serial.Serial(port, baudrate)
+                DroneSerialHandler.open_serial(port, baudrate, binary, speed)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "connected"}).encode())
+                self.send_json({"status": "connected"})
                 
+            except ValueError as e:
+                self.send_json({"error": str(e)}, status=400)
             except Exception as e:
                 logger.error(f"Connection error: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self.send_json({"error": str(e)}, status=500)
             return
             
         elif self.path == '/send_command':
             try:
                 command = data.get('command')
+                drone_id = int(data.get('drone_id', DEFAULT_DRONE_ID))
                 
-                if not DroneSerialHandler.serial_port or not DroneSerialHandler.serial_port.is_open:
+                if not DroneSerialHandler.is_connected():
                     raise Exception("Serial port not connected")
                     
-                # Add command terminator
-                command = f"{command}\n"
-                DroneSerialHandler.serial_port.write(command.encode())
-                
                 # Wait for response if it's a query command
                 if '?' in command:
-                    response = self.read_response()
-                else:
-                    # Flush the write buffer
-                    DroneSerialHandler.serial_port.flush()
-                    response = {"status": "sent", "command": command.strip()}
+                    with DroneSerialHandler.query_lock:
+                        wire = DroneSerialHandler.encode_command(command, drone_id)
+                        # The port is only held for the write, so LAND/DISARM never wait on a reply
+                        with DroneSerialHandler.serial_lock:
+                            if DroneSerialHandler.serial_reader:
+                                # Drop replies to earlier queries so they are not mistaken for ours
+                                DroneSerialHandler.serial_reader.clear_responses()
+                            DroneSerialHandler.write_serial(wire)
+                        response = self.read_response()
+                    self.send_json(response)
+                    return
+
+                ticket = DroneSerialHandler.scheduler.submit(command, drone_id, data.get('priority'))
+                with TRACER.span('serial wait', 'serial', command=command):
+                    if data.get('await_ack'):
+                        # Hold the response until the drone confirms or retries run out
+                        ticket.wait_settled(self.ack_wait_timeout())
+                    else:
+                        ticket.wait(self.command_timeout)
+                COMMAND_RESULTS.labels(ticket.status).inc()
+                if ticket.status == 'failed':
+                    raise Exception(ticket.error)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps(response).encode())
+                self.send_json(ticket.to_dict())
                     
             except Exception as e:
                 logger.error(f"Command error: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self.send_json({"error": str(e)}, status=500)
+            return
+
+        elif self.path == '/recording/start':
+            try:
+                recorder = DroneSerialHandler.start_recording(data.get('name'))
+                self.send_json({"status": "recording", "path": recorder.path})
+            except ValueError as e:
+                self.send_json({"error": str(e)}, status=400)
+            except Exception as e:
+                logger.error(f"Recording error: {e}")
+                self.send_json({"error": str(e)}, status=500)
+            return
+
+        elif self.path == '/recording/stop':
+            recorder = DroneSerialHandler.stop_recording()
+            if recorder:
+                self.send_json({
+                    "status": "stopped",
+                    "path": recorder.path,
+                    "bytes": recorder.bytes_recorded
+                })
+            else:
+                self.send_json({"error": "Not recording"}, status=409)
+            return
+
+        elif self.path == '/debug/tracing':
+            # {"enabled": true|false, "clear": true} toggles span recording without a restart
+            if 'enabled' in data:
+                TRACER.enabled = bool(data['enabled'])
+            if data.get('clear'):
+                TRACER.clear()
+            self.send_json({"enabled": TRACER.enabled, "spans": len(TRACER)})
+            return
+
+        elif self.path == '/debug/profiler/start':
+            profiler = DroneSerialHandler.profiler
+            if profiler and profiler.running:
+                self.send_json({"error": "Profiler is already running"}, status=409)
+                return
+            try:
+                interval = float(data.get('interval', 0.005))
+                if interval <= 0:
+                    raise ValueError("interval must be positive")
+            except (TypeError, ValueError) as e:
+                self.send_json({"error": f"Invalid interval: {e}"}, status=400)
+                return
+            DroneSerialHandler.profiler = SamplingProfiler(interval)
+            DroneSerialHandler.profiler.start()
+            logger.info(f"Sampling profiler started, every {interval * 1000:g} ms")
+            self.send_json({"status": "profiling", "interval": interval})
+            return
+
+        elif self.path == '/debug/profiler/stop':
+            profiler = DroneSerialHandler.profiler
+            if not (profiler and profiler.running):
+                self.send_json({"error": "Profiler is not running"}, status=409)
+                return
+            profiler.stop()
+            logger.info(f"Sampling profiler stopped with {profiler.sample_count} samples")
+            self.send_json({
+                "status": "stopped",
+                "samples": profiler.sample_count,
+                "duration": profiler.stopped_at - profiler.started_at
+            })
+            return
+
+        elif self.path == '/formation':
+            if formation is None:
+                self.send_json({"error": "Formations require numpy"}, status=501)
+                return
+            try:
+                # Without an explicit count, every drone that has reported telemetry takes part
+                drone_ids = sorted(DroneSerialHandler.history.drones()) or [DEFAULT_DRONE_ID]
+                if 'count' in data:
+                    count = int(data['count'])
+                    if not 1 <= count <= formation.MAX_DRONES:
+                        raise ValueError(f"count must be between 1 and {formation.MAX_DRONES}")
+                    drone_ids = list(range(1, count + 1))
+                result = formation.compute(
+                    float(data['latitude']),
+                    float(data['longitude']),
+                    float(data.get('altitude', 0)),
+                    len(drone_ids),
+                    float(data.get('separation', 2)),
+                    data.get('pattern', 'line'),
+                    float(data.get('heading', 0)),
+                    data.get('min_separation'),
+                )
+                result['drone_ids'] = drone_ids
+                self.send_json(result)
+            except (KeyError, TypeError, ValueError) as e:
+                self.send_json({"error": f"Invalid formation request: {e}"}, status=400)
+            return
+
+        elif self.path == '/send_commands':
+            try:
+                entries = data.get('commands')
+                if not isinstance(entries, list) or not entries:
+                    self.send_json({"error": "Expected a non-empty 'commands' list"}, status=400)
+                    return
+
+                if not DroneSerialHandler.is_connected():
+                    raise Exception("Serial port not connected")
+
+                batch = []
+                for entry in entries:
+                    # Plain strings target the default drone
+                    if isinstance(entry, str):
+                        entry = {"command": entry}
+                    batch.append((
+                        entry['command'],
+                        int(entry.get('drone_id', DEFAULT_DRONE_ID)),
+                        entry.get('priority')
+                    ))
+
+                tickets = DroneSerialHandler.scheduler.submit_batch(batch)
+                await_ack = data.get('await_ack')
+                timeout = self.ack_wait_timeout() if await_ack else self.command_timeout
+                deadline = time.monotonic() + timeout
+                with TRACER.span('serial wait', 'serial', commands=len(tickets)):
+                    for ticket in tickets:
+                        remaining = max(deadline - time.monotonic(), 0)
+                        if await_ack:
+                            ticket.wait_settled(remaining)
+                        else:
+                            ticket.wait(remaining)
+
+                self.send_json({"results": [ticket.to_dict() for ticket in tickets]})
+
+            except (KeyError, TypeError, ValueError) as e:
+                self.send_json({"error": f"Invalid command entry: {e}"}, status=400)
+            except Exception as e:
+                logger.error(f"Batch command error: {e}")
+                self.send_json({"error": str(e)}, status=500)
             return
 
         self.send_error(404)
 
-    def read_response(self, timeout=1.0):
-        """Read response from serial port for query commands"""
-        if not DroneSerialHandler.serial_port:
+    def ack_wait_timeout(self):
+        """Longest a command can take to settle, including every retransmit"""
+        tracker = DroneSerialHandler.ack_tracker
+        return self.command_timeout + tracker.ack_timeout * (tracker.max_retries + 1)
+
+    def read_response(self, timeout=1.0, line_gap=0.05):
+        """Collect response lines queued by the serial reader for query commands"""
+        reader = DroneSerialHandler.serial_reader
+        if not reader:
             return {"error": "No serial connection"}
-            
-        start_time = time.time()
+
         response = []
-        
-        while (time.time() - start_time) < timeout:
-            if DroneSerialHandler.serial_port.in_waiting:
-                line = DroneSerialHandler.serial_port.readline().decode().strip()
-                response.append(line)
-                if not DroneSerialHandler.serial_port.in_waiting:
-                    break
-                    
-        return {"response": response} if response else {"error": "No response"}
-
-def start_http_server():
-    try:
-        # Change working directory to where run_app.py is located
-        os.chdir(BASE_DIR)
-        server = HTTPServer(('127.0.0.1', 5000), DroneSerialHandler)
-        logger.info(f"HTTP server running on http://127.0.0.1:5000 from {BASE_DIR}")
-        server.serve_forever()
-    except Exception as e:
-        logger.error(f"Failed to start HTTP server: {e}")
-        raise
+        started = time.perf_counter()
+        with TRACER.span('serial read', 'serial'):
+            try:
+                # Wait for the first line, then take whatever follows it closely
+                response.append(reader.responses.get(timeout=timeout))
+                SERIAL_RESPONSE_SECONDS.observe(time.perf_counter() - started)
+                while True:
+                    response.append(reader.responses.get(timeout=line_gap))
+            except queue.Empty:
+                pass
+
+        if not response:
+            SERIAL_RESPONSE_TIMEOUTS.inc()
+            return {"error": "No response"}
+        return {"response": response}
+
+SERIAL_CONNECTED.set_function(lambda: int(DroneSerialHandler.is_connected()))
+
+def create_http_server():
+    """Bind the HTTP server; it accepts connections as soon as this returns"""
+    # Change working directory to where run_app.py is located
+    os.chdir(BASE_DIR)
+    # Warm the asset cache so the first UI load is served from memory
+    DroneSerialHandler.assets.preload(
+        os.path.join(BASE_DIR, name) for name in ('index.html', 'index.css', 'script.js'))
+    # Pooled so slow serial queries and telemetry streams do not block other requests
+    server = PooledHTTPServer(('127.0.0.1', 5000), DroneSerialHandler)
+    logger.info(f"HTTP server running on http://127.0.0.1:5000 from {BASE_DIR}")
+    return server
 
 class ApplicationManager:
+    """Runs the HTTP server, port watcher and Electron UI under one Supervisor"""
     def __init__(self):
-        self.electron_process = None
-        self.running = True
+        self.supervisor = Supervisor()
 
-    def start_electron(self):
-        """Start Electron application"""
-        try:
-            self.electron_process = subprocess.Popen(
-                ['npx', 'electron', '.'], 
-                shell=True
-            )
-            logger.info("Electron app started")
-        except Exception as e:
-            logger.error(f"Failed to start Electron: {e}")
-            self.running = False
+    def close_serial(self):
+        DroneSerialHandler.stop_recording()
+        DroneSerialHandler.close_serial()
 
     def run(self):
         """Main application entry point"""
         try:
-            # Start HTTP server in separate thread
-            http_thread = Thread(target=start_http_server)
-            http_thread.daemon = True
-            http_thread.start()
-
-            # Start Electron in main thread
-            self.start_electron()
-
-            # Keep main thread alive
-            while self.running:
-                if self.electron_process.poll() is not None:
-                    logger.info("Electron process ended")
-                    break
-                time.sleep(0.1)
-
-        except KeyboardInterrupt:
-            logger.info("Received shutdown signal")
-        finally:
-            self.cleanup()
-
-    def cleanup(self):
-        """Clean shutdown of all components"""
-        self.running = False
-        
-        if DroneSerialHandler.serial_port and DroneSerialHandler.serial_port.is_open:
-            DroneSerialHandler.serial_port.close()
-        
-        if self.electron_process:
-            self.electron_process.terminate()
-            try:
-                self.electron_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.electron_process.kill()
+            server = create_http_server()
+        except Exception as e:
+            logger.error(f"Failed to start HTTP server: {e}")
+            raise
 
+        # Stopped in reverse order: UI first, serial connection last
+        self.supervisor.add_service('serial', lambda: None, self.close_serial)
+        self.supervisor.add_service('port-registry', DroneSerialHandler.ports.start, DroneSerialHandler.ports.stop)
+        self.supervisor.add_thread('http-server', server.serve_forever, server.shutdown)
+        # The socket is already listening, so the UI can start without waiting
+        self.supervisor.add_process('electron', ['npx', 'electron', '.'], critical=True, shell=True)
+        self.supervisor.run()
+        server.server_close()
         logger.info("Application shutdown complete")
 
 def main():
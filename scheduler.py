@@ -0,0 +1,439 @@
+"""Per-drone command scheduling for the shared GCS serial link.
+
+Every drone gets its own queue. Safety commands jump ahead of everything else,
+and the rest are served round-robin so one busy drone cannot starve the others.
+Writes are paced to what the UART can carry, so queued commands wait here rather
+than in the OS serial buffer where a LAND could not overtake them. Commands
+that are ready together are encoded into a single write.
+
+The drone answers every command with a telemetry frame (OnDataRecv in
+esp32_mcu.ino), but it also sends one every second unprompted, so a frame only
+confirms a command whose effect it shows. AckTracker uses those frames to
+confirm delivery and retransmits commands that go unanswered.
+"""
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from threading import Condition, Event, Thread
+
+logger = logging.getLogger(__name__)
+
+# Always written before any other queued command
+SAFETY_COMMANDS = {'LAND', 'DISARM'}
+# Only the newest pending command of these kinds matters per drone
+COALESCED_COMMANDS = {'MODE', 'POSHOLD', 'HEARTBEAT', 'TELEMETRY'}
+
+def command_verb(command):
+    return command.split(None, 1)[0] if command.strip() else ''
+
+def supersedes(new, old):
+    """Whether sending ticket `new` makes retransmitting ticket `old` wrong"""
+    if new.drone_id != old.drone_id:
+        return False
+    new_verb, old_verb = command_verb(new.command), command_verb(old.command)
+    if new.priority == 'safety' and old.priority != 'safety':
+        return True
+    if new_verb == old_verb and new_verb in COALESCED_COMMANDS:
+        return True
+    return {new_verb, old_verb} == {'ARM', 'DISARM'}
+
+def expected_state(command):
+    """Return a predicate telling whether a telemetry frame reflects `command`.
+
+    Commands without an observable effect in DroneTelemetry (TAKEOFF, LAND,
+    POSHOLD, HEARTBEAT) return None: no frame can confirm them.
+    """
+    parts = command.split()
+    verb = parts[0] if parts else ''
+    if verb == 'ARM':
+        return lambda frame: frame['armed']
+    if verb == 'DISARM':
+        return lambda frame: not frame['armed']
+    if verb == 'MODE' and len(parts) > 1 and parts[1].isdigit():
+        mode = int(parts[1])
+        return lambda frame: frame['mode'] == mode
+    return None
+
+class CommandTicket:
+    """Handle for a submitted command.
+
+    `wait` returns once the command is written or dropped; `wait_settled` once
+    delivery is confirmed or given up on as well.
+
+    Only 'acked' means the drone is known to have carried the command out.
+    'unconfirmed' means it was written but nothing in telemetry can show
+    whether it arrived, so the UI must not report it as confirmed;
+    'unacknowledged' means every retry went unanswered.
+    """
+    # Statuses after which nothing more will happen to the ticket
+    FINAL_STATUSES = {'acked', 'unacknowledged', 'unconfirmed', 'coalesced', 'failed', 'cancelled'}
+
+    def __init__(self, ticket_id, command, drone_id, priority):
+        self.id = ticket_id
+        self.command = command
+        self.drone_id = drone_id
+        self.priority = priority
+        self.status = 'queued'
+        self.error = None
+        self.attempts = 0
+        self.submitted_at = time.monotonic()
+        self.sent_at = None
+        self.acked_at = None
+        self._done = Event()
+        self._settled = Event()
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        if status == 'sent':
+            self.attempts += 1
+            if self.sent_at is None:
+                self.sent_at = time.monotonic()
+        elif status == 'acked':
+            self.acked_at = time.monotonic()
+        self._done.set()
+        if status in self.FINAL_STATUSES:
+            self._settled.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def wait_settled(self, timeout=None):
+        return self._settled.wait(timeout)
+
+    def to_dict(self):
+        result = {
+            "id": self.id,
+            "command": self.command,
+            "drone_id": self.drone_id,
+            "status": self.status,
+            "attempts": self.attempts,
+        }
+        if self.sent_at is not None:
+            result["queue_delay"] = self.sent_at - self.submitted_at
+        if self.acked_at is not None:
+            # End to end: from the first write to the drone's confirming frame
+            result["ack_latency"] = self.acked_at - self.sent_at
+        if self.error:
+            result["error"] = self.error
+        return result
+
+class CommandScheduler:
+    """Serializes commands for many drones onto one rate-limited writer.
+
+    `write(data)` performs the actual serial write and `encode(command, drone_id)`
+    turns a command into wire bytes. `bytes_per_second` is the usable link
+    capacity; at 8N1 framing that is baudrate / 10.
+    """
+    def __init__(self, write, encode, bytes_per_second=11520, max_write_bytes=256, tracker=None):
+        self.write = write
+        self.encode = encode
+        # Optional AckTracker that is told about every written command
+        self.tracker = tracker
+        self.bytes_per_second = bytes_per_second
+        # Bounds how long a safety command can wait behind one combined write
+        self.max_write_bytes = max_write_bytes
+        self._safety = deque()
+        self._queues = OrderedDict()  # drone_id -> deque of tickets, in round-robin order
+        self._ids = itertools.count(1)
+        self._cond = Condition()
+        self._next_write = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name='command-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        # Nothing will write the remaining commands any more
+        for ticket in self._drain():
+            ticket.finish('cancelled', "Scheduler stopped")
+
+    def submit(self, command, drone_id, priority=None):
+        """Queue `command` for `drone_id` and return its CommandTicket.
+
+        `priority` is 'safety' or 'normal'; by default it follows SAFETY_COMMANDS.
+        """
+        return self.submit_batch([(command, drone_id, priority)])[0]
+
+    def submit_batch(self, commands):
+        """Queue several `(command, drone_id, priority)` entries at once.
+
+        They become visible to the writer together, so they go out in as few
+        serial writes as `max_write_bytes` allows.
+        """
+        tickets = []
+        with self._cond:
+            for command, drone_id, priority in commands:
+                command = command.strip()
+                verb = command_verb(command)
+                if priority is None:
+                    priority = 'safety' if verb in SAFETY_COMMANDS else 'normal'
+                ticket = CommandTicket(next(self._ids), command, drone_id, priority)
+                if priority == 'safety':
+                    self._cancel_superseded(ticket)
+                    self._safety.append(ticket)
+                else:
+                    pending = self._queues.setdefault(drone_id, deque())
+                    self._coalesce(pending, ticket, verb)
+                tickets.append(ticket)
+            self._cond.notify()
+        return tickets
+
+    def resubmit(self, ticket):
+        """Queue an already-sent ticket again for retransmission.
+
+        A retransmit never overtakes a newer queued command it conflicts with;
+        the old ticket is settled as coalesced instead.
+        """
+        with self._cond:
+            queued = list(self._safety) + list(self._queues.get(ticket.drone_id, ()))
+            if any(other is not ticket and (supersedes(other, ticket) or other.command == ticket.command)
+                   for other in queued):
+                ticket.finish('coalesced')
+                return
+            if ticket.priority == 'safety':
+                self._safety.append(ticket)
+            else:
+                self._queues.setdefault(ticket.drone_id, deque()).append(ticket)
+            self._cond.notify()
+
+    def _cancel_superseded(self, ticket):
+        """Drop queued commands for the drone that a safety `ticket` overrides.
+
+        Otherwise a DISARM would jump ahead of an earlier ARM or TAKEOFF that
+        then still goes out after it.
+        """
+        pending = self._queues.get(ticket.drone_id)
+        if not pending:
+            return
+        superseded = [queued for queued in pending if supersedes(ticket, queued)]
+        for queued in superseded:
+            pending.remove(queued)
+            queued.finish('cancelled', f"Superseded by {ticket.command}")
+        if not pending:
+            del self._queues[ticket.drone_id]
+
+    def _coalesce(self, pending, ticket, verb):
+        """Replace an equivalent pending command in place, or append `ticket`"""
+        for index, queued in enumerate(pending):
+            queued_verb = command_verb(queued.command)
+            if queued.command == ticket.command or (verb in COALESCED_COMMANDS and queued_verb == verb):
+                pending[index] = ticket
+                queued.finish('coalesced')
+                return
+        pending.append(ticket)
+
+    def pending(self):
+        """Number of queued commands per drone, with safety commands under 'safety'"""
+        with self._cond:
+            counts = {str(drone_id): len(tickets) for drone_id, tickets in self._queues.items()}
+            counts['safety'] = len(self._safety)
+            return counts
+
+    def _drain(self):
+        with self._cond:
+            tickets = list(self._safety)
+            self._safety.clear()
+            for pending in self._queues.values():
+                tickets.extend(pending)
+            self._queues.clear()
+        return tickets
+
+    def _pop(self):
+        if self._safety:
+            return self._safety.popleft()
+        while self._queues:
+            drone_id, pending = next(iter(self._queues.items()))
+            # Rotate the drone to the back so others get the next slot
+            self._queues.move_to_end(drone_id)
+            if pending:
+                ticket = pending.popleft()
+                if not pending:
+                    del self._queues[drone_id]
+                return ticket
+            del self._queues[drone_id]
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running or self._safety or self._queues)
+                if not self._running:
+                    return
+                # Pace to link capacity; a safety command arriving now is still picked first
+                delay = self._next_write - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                batch = self._take_batch()
+            if not batch:
+                continue
+
+            data = b''.join(chunk for _, chunk in batch)
+            try:
+                self.write(data)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} command(s): {e}")
+                for ticket, _ in batch:
+                    ticket.finish('failed', str(e))
+                continue
+            self._next_write = time.monotonic() + len(data) / self.bytes_per_second
+            for ticket, _ in batch:
+                ticket.finish('sent')
+                if self.tracker:
+                    self.tracker.track(ticket)
+
+    def _take_batch(self):
+        """Pop and encode ready commands until `max_write_bytes` is reached"""
+        batch = []
+        size = 0
+        while size < self.max_write_bytes:
+            ticket = self._pop()
+            if ticket is None:
+                break
+            try:
+                chunk = self.encode(ticket.command, ticket.drone_id)
+            except Exception as e:
+                logger.error(f"Cannot encode {ticket.command!r} for drone {ticket.drone_id}: {e}")
+                ticket.finish('failed', str(e))
+                continue
+            batch.append((ticket, chunk))
+            size += len(chunk)
+        return batch
+
+class AckTracker:
+    """In-flight table matching drone telemetry to written commands.
+
+    A ticket counts as acknowledged by the first frame from its drone that
+    satisfies `expected_state`. Tickets unanswered after `ack_timeout` are
+    handed back to the scheduler up to `max_retries` times, then reported as
+    'unacknowledged'.
+
+    Only commands that telemetry can confirm are tracked: the drone must have
+    identified itself in telemetry, and the command must have an
+    `expected_state`. The stock GCS firmware sends no drone id, so its frames
+    are all attributed to the default drone. Other commands are written once
+    and settled as 'unconfirmed', since an unrelated periodic frame would
+    otherwise pass for their ack.
+    """
+    def __init__(self, ack_timeout=0.5, max_retries=2):
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.scheduler = None
+        self._in_flight = {}  # drone_id -> list of (deadline, ticket, predicate)
+        self._identified = set()  # drone ids seen in telemetry
+        self._cond = Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self, scheduler):
+        self.scheduler = scheduler
+        scheduler.tracker = self
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name='ack-tracker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            pending = [entry[1] for entries in self._in_flight.values() for entry in entries]
+            self._in_flight.clear()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        for ticket in pending:
+            ticket.finish('cancelled', "Tracker stopped")
+
+    def track(self, ticket):
+        predicate = expected_state(ticket.command)
+        entry = (time.monotonic() + self.ack_timeout, ticket, predicate)
+        with self._cond:
+            trackable = predicate is not None and ticket.drone_id in self._identified
+            entries = self._in_flight.get(ticket.drone_id, [])
+            # Stop waiting on older commands this one overrides, so they are never retried
+            superseded = [old for old in entries if old[1] is not ticket and supersedes(ticket, old[1])]
+            entries = [old for old in entries if old not in superseded and old[1] is not ticket]
+            if trackable:
+                entries.append(entry)
+            if entries:
+                self._in_flight[ticket.drone_id] = entries
+            else:
+                self._in_flight.pop(ticket.drone_id, None)
+            self._cond.notify()
+        for _, old, _ in superseded:
+            old.finish('coalesced')
+        if not trackable:
+            # No frame can confirm this command, so there is nothing to wait for
+            ticket.finish('unconfirmed')
+
+    def in_flight(self):
+        with self._cond:
+            return sum(len(entries) for entries in self._in_flight.values())
+
+    def on_telemetry(self, frame):
+        """Settle in-flight commands for the frame's drone that it confirms"""
+        with self._cond:
+            self._identified.add(frame['drone_id'])
+            entries = self._in_flight.get(frame['drone_id'])
+            if not entries:
+                return
+            acked = [entry for entry in entries if entry[2](frame)]
+            if not acked:
+                return
+            remaining = [entry for entry in entries if entry not in acked]
+            if remaining:
+                self._in_flight[frame['drone_id']] = remaining
+            else:
+                del self._in_flight[frame['drone_id']]
+        for _, ticket, _ in acked:
+            ticket.finish('acked')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                expired = []
+                next_deadline = None
+                for drone_id in list(self._in_flight):
+                    live = []
+                    for entry in self._in_flight[drone_id]:
+                        if entry[0] <= now:
+                            expired.append(entry[1])
+                        else:
+                            live.append(entry)
+                            if next_deadline is None or entry[0] < next_deadline:
+                                next_deadline = entry[0]
+                    if live:
+                        self._in_flight[drone_id] = live
+                    else:
+                        del self._in_flight[drone_id]
+                if not expired:
+                    self._cond.wait(None if next_deadline is None else next_deadline - now)
+                    continue
+
+            for ticket in expired:
+                if ticket.attempts <= self.max_retries:
+                    logger.warning(f"No ack for {ticket.command!r} to drone {ticket.drone_id}, retrying")
+                    ticket.status = 'retrying'
+                    self.scheduler.resubmit(ticket)
+                else:
+                    ticket.finish('unacknowledged', f"No reply after {ticket.attempts} attempts")
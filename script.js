@@ -73,7 +73,7 @@ function initializeElements() {
         // Top Bar Controls
         leaderPosCoords: document.querySelector('.coordinates'),
         separationInput: document.querySelector('.measurement input'),
-        operatingAltInput: document.querySelector('.measurement-12 input'),
+        operatingAltInput: document.querySelector('.operation-altitude input'),
         programSelect: document.querySelector('.program-select'),
         startBtn: document.querySelector('.start'),
         pauseBtn: document.querySelector('.pause'),
@@ -165,6 +165,7 @@ class SerialConnection {
         try {
             this.portSelect?.addEventListener('click', () => this.listPorts());
             this.portSelect?.addEventListener('change', (e) => this.connect(e.target.value));
+            this.watchPorts();
         } catch (error) {
             handleError(error, 'initializing serial listeners');
         }
@@ -182,6 +183,20 @@ class SerialConnection {
         }
     }
 
+    // The server pushes a diff whenever a serial device is plugged or unplugged
+    watchPorts() {
+        const source = new EventSource('http://127.0.0.1:5000/ports/stream');
+        source.onmessage = (event) => {
+            const change = JSON.parse(event.data);
+            this.updatePortList(change.ports);
+            change.added.forEach(port => customAlert.show(`Port connected: ${port.port}`));
+            change.removed.forEach(port => {
+                customAlert.warning(`Port disconnected: ${port.port}`);
+                if (port.port === this.port) this.isConnected = false;
+            });
+        };
+    }
+
     updatePortList(ports) {
         if (!this.portSelect) return;
         
@@ -207,7 +222,9 @@ class SerialConnection {
             if (!response.ok) throw new Error('Connection failed');
             
             const result = await response.json();
+            this.port = portName;
             this.isConnected = true;
+            telemetryStream.start();
             customAlert.success('Connected to ' + portName);
             
         } catch (error) {
@@ -215,7 +232,8 @@ class SerialConnection {
         }
     }
 
-    async sendCommand(command) {
+    // With awaitAck the request resolves once the drone confirms the command
+    async sendCommand(command, { droneId, awaitAck = false } = {}) {
         try {
             if (!this.isConnected) {
                 throw new Error('Not connected to any port');
@@ -224,7 +242,7 @@ class SerialConnection {
             const response = await fetch('http://127.0.0.1:5000/send_command', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ command })
+                body: JSON.stringify({ command, drone_id: droneId, await_ack: awaitAck })
             });
 
             if (!response.ok) throw new Error('Failed to send command');
@@ -244,6 +262,46 @@ class SerialConnection {
 // Initialize serial connection
 const serialConnection = new SerialConnection();
 
+// Live Telemetry
+const FLIGHT_MODES = {
+    1: 'STABILIZE',
+    2: 'ALT_HOLD',
+    3: 'LOITER',
+    4: 'RTL',
+    5: 'AUTO'
+};
+
+class TelemetryStream {
+    constructor() {
+        this.source = null;
+    }
+
+    start() {
+        if (this.source) return;
+
+        // The server pushes a frame for every telemetry line it receives
+        this.source = new EventSource('http://127.0.0.1:5000/telemetry/stream');
+        this.source.onmessage = (event) => this.handleFrame(JSON.parse(event.data));
+        this.source.onerror = () => console.warn('Telemetry stream interrupted, reconnecting');
+    }
+
+    stop() {
+        this.source?.close();
+        this.source = null;
+    }
+
+    handleFrame(frame) {
+        currentDrone.currentAltitude = frame.altitude.toFixed(1);
+        currentDrone.batteryLevel = Math.round(frame.battery);
+        currentDrone.currentMode = FLIGHT_MODES[frame.mode] || currentDrone.currentMode;
+        currentDrone.isArmed = frame.armed;
+        currentDrone.satellites = frame.satellites;
+        updateDroneStatus();
+    }
+}
+
+const telemetryStream = new TelemetryStream();
+
 // Drone Control Functions
 async function handleArm() {
     try {
@@ -252,9 +310,16 @@ async function handleArm() {
 
         currentDrone.isArmed = !currentDrone.isArmed;
         
-        await serialConnection.sendCommand(currentDrone.isArmed ? 'ARM' : 'DISARM');
+        const result = await serialConnection.sendCommand(
+            currentDrone.isArmed ? 'ARM' : 'DISARM',
+            { awaitAck: true }
+        );
         
         resetLoading();
+
+        if (result?.status === 'unacknowledged') {
+            customAlert.warning('Drone did not confirm ' + result.command);
+        }
         
         if (currentDrone.isArmed) {
             armButton.style.background = '#f05151';
@@ -480,8 +545,40 @@ function updateDroneStatus() {
     document.querySelector('.battery').textContent = `Battery: ${currentDrone.batteryLevel}%`;
 }
 
-function updateFormation() {
-    // Implementation for updating drone formation
+// Recomputes formation targets on the server whenever a top bar input changes
+async function updateFormation() {
+    const [latitude, longitude] = (elements.leaderPosCoords?.textContent || '').split(',').map(parseFloat);
+    if (!Number.isFinite(latitude) || !Number.isFinite(longitude)) {
+        return null;
+    }
+
+    try {
+        const response = await fetch('http://127.0.0.1:5000/formation', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                latitude,
+                longitude,
+                altitude: parseFloat(elements.operatingAltInput?.value) || 0,
+                separation: parseFloat(elements.separationInput?.value) || 0,
+                pattern: elements.programSelect?.value || 'line'
+            })
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.error);
+        }
+        if (!result.safe) {
+            customAlert.warning(`Formation too tight: drones ${result.min_separation.toFixed(1)}m apart`);
+        }
+        if (map) {
+            showFormationTargets(result);
+        }
+        return result;
+    } catch (error) {
+        handleError(error, 'updating formation');
+        return null;
+    }
 }
 
 function startMission() {
@@ -530,14 +627,14 @@ function initializeMap() {
             attributionControl: false
         });
 
-        // Light mode tiles
-        const lightMode = L.tileLayer('https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png', {
+        // Light mode tiles, proxied and cached on disk by the local server
+        const lightMode = L.tileLayer('http://127.0.0.1:5000/tiles/light/{z}/{x}/{y}.png', {
             maxZoom: 19,
             minZoom: 2
         });
 
         // Satellite mode tiles
-        const satelliteMode = L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', {
+        const satelliteMode = L.tileLayer('http://127.0.0.1:5000/tiles/satellite/{z}/{x}/{y}.jpg', {
             maxZoom: 19,
             minZoom: 2
         });
@@ -607,6 +704,38 @@ function updateDroneMarker(droneId, position) {
     }
 }
 
+let formationMarkers = new Map();
+
+function showFormationTargets(result) {
+    const targetIcon = L.divIcon({
+        className: 'formation-target',
+        html: `<div style="
+            width: 10px;
+            height: 10px;
+            border: 2px dashed #2c7bf2;
+            border-radius: 50%;
+        "></div>`,
+        iconSize: [10, 10]
+    });
+
+    result.drone_ids.forEach((droneId, index) => {
+        const position = [result.latitude[index], result.longitude[index]];
+        if (!formationMarkers.has(droneId)) {
+            formationMarkers.set(droneId, L.marker(position, { icon: targetIcon }).addTo(map));
+        } else {
+            formationMarkers.get(droneId).setLatLng(position);
+        }
+    });
+
+    // Drop targets for drones no longer in the formation
+    formationMarkers.forEach((marker, droneId) => {
+        if (!result.drone_ids.includes(droneId)) {
+            marker.remove();
+            formationMarkers.delete(droneId);
+        }
+    });
+}
+
 // Add event listeners for mode options
 function initializeModeOptions() {
     const modeOptions = document.querySelectorAll('.mode-option');
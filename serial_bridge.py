@@ -1 +1,349 @@
- 
\ No newline at end of file
+"""Serial-to-socket bridge that lets several processes share the GCS radio link.
+
+The bridge is the only process that opens the serial device. Clients connect
+over TCP (`tcp:127.0.0.1:5760`) or a Unix socket (`unix:/tmp/gcs.sock`) and see
+the GCS output as if they had the port themselves:
+
+  * Everything the GCS sends is split into whole units (text lines, or framed
+    telemetry structs in binary mode) and fanned out to every client through a
+    bounded per-client queue. A client that falls behind either loses its
+    oldest units (`drop-oldest`, the default) or is disconnected
+    (`disconnect`); it never slows down the other clients or the port.
+  * Commands from all clients are merged onto the port one whole unit at a
+    time, so two clients can never interleave halves of a command.
+
+`BridgePort` is the client side, a stand-in for `serial.Serial` that run_app.py
+uses for `bridge:` ports.
+"""
+import argparse
+import logging
+import os
+import queue
+import select
+import socket
+from threading import Event, Lock, Thread
+
+import serial
+
+import protocol
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = 'tcp:127.0.0.1:5760'
+DROP_OLDEST = 'drop-oldest'
+DISCONNECT = 'disconnect'
+
+def parse_address(address):
+    """Split `tcp:host:port` or `unix:path` into (socket family, socket address)"""
+    scheme, _, rest = address.partition(':')
+    if scheme == 'unix':
+        return socket.AF_UNIX, rest
+    if scheme == 'tcp':
+        host, _, port = rest.rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    raise ValueError(f"Unsupported bridge address {address!r}, expected tcp:host:port or unix:path")
+
+class UnitSplitter:
+    """Splits a byte stream into whole lines or binary frames"""
+    def __init__(self, binary, frame_size):
+        self.binary = binary
+        self.decoder = protocol.FrameDecoder(frame_size)
+        self._pending = bytearray()
+
+    def feed(self, data):
+        if self.binary:
+            return [protocol.SYNC + body for body in self.decoder.feed(data)]
+        self._pending.extend(data)
+        end = self._pending.rfind(b'\n') + 1
+        if not end:
+            return []
+        units = bytes(self._pending[:end]).splitlines(keepends=True)
+        del self._pending[:end]
+        return units
+
+class BridgeClient:
+    """One connected socket with its bounded outgoing queue"""
+    def __init__(self, bridge, connection, name):
+        self.bridge = bridge
+        self.connection = connection
+        self.name = name
+        self.outgoing = queue.Queue(maxsize=bridge.max_queue)
+        self.dropped = 0
+        self.closed = Event()
+
+    def start(self):
+        Thread(target=self._send, name=f'bridge-send-{self.name}', daemon=True).start()
+        Thread(target=self._receive, name=f'bridge-recv-{self.name}', daemon=True).start()
+
+    def offer(self, unit):
+        """Queue a unit without blocking, applying the bridge's drop policy"""
+        while not self.closed.is_set():
+            try:
+                self.outgoing.put_nowait(unit)
+                return
+            except queue.Full:
+                if self.bridge.policy == DISCONNECT:
+                    logger.warning(f"Bridge client {self.name} fell behind, disconnecting")
+                    self.close()
+                    return
+                try:
+                    self.outgoing.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _send(self):
+        while not self.closed.is_set():
+            unit = self.outgoing.get()
+            if unit is None:
+                break
+            # Send whatever else is already queued in the same call
+            units = [unit]
+            while len(units) < 64:
+                try:
+                    unit = self.outgoing.get_nowait()
+                except queue.Empty:
+                    break
+                if unit is None:
+                    break
+                units.append(unit)
+            try:
+                self.connection.sendall(b''.join(units))
+            except OSError:
+                break
+        self.close()
+
+    def _receive(self):
+        splitter = UnitSplitter(self.bridge.binary, protocol.MESSAGE_FRAME_SIZE)
+        while not self.closed.is_set():
+            try:
+                data = self.connection.recv(4096)
+            except OSError:
+                break
+            if not data:
+                break
+            for unit in splitter.feed(data):
+                self.bridge.write(unit)
+        self.close()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        try:
+            self.outgoing.put_nowait(None)  # Wake the sender
+        except queue.Full:
+            pass
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+        self.bridge.remove(self)
+        logger.info(f"Bridge client {self.name} disconnected ({self.dropped} units dropped)")
+
+class SerialBridge:
+    """Owns the serial port and shares it with every connected client"""
+    def __init__(self, port, baudrate=115200, address=DEFAULT_ADDRESS, binary=False,
+                 max_queue=1024, policy=DROP_OLDEST, open_port=None, reconnect_delay=2.0):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Unknown drop policy {policy!r}")
+        self.port_name = port
+        self.baudrate = baudrate
+        self.address = address
+        self.binary = binary
+        self.max_queue = max_queue
+        self.policy = policy
+        self.reconnect_delay = reconnect_delay
+        # A short read timeout lets the reader notice stop requests
+        self._open_port = open_port or (lambda: serial.Serial(port, baudrate, timeout=0.1))
+        self._port = None
+        self._write_lock = Lock()
+        self._clients_lock = Lock()
+        self._clients = set()
+        self._client_count = 0
+        self._server = None
+        self._stop_event = Event()
+
+    def start(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)  # Stale socket from a previous run
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen()
+        logger.info(f"Serial bridge for {self.port_name} listening on {self.address}")
+        Thread(target=self._accept, name='bridge-accept', daemon=True).start()
+        Thread(target=self._read_port, name='bridge-serial', daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.close()
+        with self._clients_lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.close()
+        with self._write_lock:
+            if self._port:
+                self._port.close()
+                self._port = None
+
+    @property
+    def clients(self):
+        with self._clients_lock:
+            return len(self._clients)
+
+    def _accept(self):
+        while not self._stop_event.is_set():
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return  # Server socket closed
+            if connection.family == socket.AF_INET:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._clients_lock:
+                self._client_count += 1
+                client = BridgeClient(self, connection, str(self._client_count))
+                self._clients.add(client)
+            logger.info(f"Bridge client {client.name} connected")
+            client.start()
+
+    def remove(self, client):
+        with self._clients_lock:
+            self._clients.discard(client)
+
+    def write(self, unit):
+        """Write one whole command to the port; dropped while the port is down"""
+        with self._write_lock:
+            if self._port is None:
+                return
+            try:
+                self._port.write(unit)
+            except (serial.SerialException, OSError) as e:
+                logger.error(f"Serial write failed: {e}")
+
+    def fan_out(self, unit):
+        with self._clients_lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.offer(unit)
+
+    def _read_port(self):
+        while not self._stop_event.is_set():
+            try:
+                port = self._open_port()
+            except (serial.SerialException, OSError) as e:
+                logger.error(f"Cannot open {self.port_name}: {e}")
+                self._stop_event.wait(self.reconnect_delay)
+                continue
+            with self._write_lock:
+                self._port = port
+            logger.info(f"Opened {self.port_name}")
+
+            splitter = UnitSplitter(self.binary, protocol.TELEMETRY_FRAME_SIZE)
+            while not self._stop_event.is_set():
+                try:
+                    chunk = port.read(port.in_waiting or 1)
+                except (serial.SerialException, OSError, TypeError) as e:
+                    if not self._stop_event.is_set():
+                        logger.error(f"Serial read error on {self.port_name}: {e}")
+                    break
+                for unit in splitter.feed(chunk):
+                    self.fan_out(unit)
+
+            with self._write_lock:
+                if self._port is port:
+                    self._port = None
+            try:
+                port.close()
+            except (serial.SerialException, OSError):
+                pass
+            # Wait before reopening a device that went away
+            self._stop_event.wait(self.reconnect_delay)
+
+class BridgePort:
+    """Stand-in for `serial.Serial` connected to a SerialBridge"""
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=0.1):
+        family, socket_address = parse_address(address)
+        self.port = f"bridge:{address}"
+        self.timeout = timeout
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.connect(socket_address)
+        if family == socket.AF_INET:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+        self._read_lock = Lock()
+        self.is_open = True
+
+    def _receive(self, timeout):
+        """Append whatever arrives within `timeout` to the buffer"""
+        # Polled with select: the socket stays blocking for the writer thread's sendall
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        if not readable:
+            return
+        data = self._socket.recv(65536)
+        if not data:
+            self.is_open = False
+            raise OSError("Serial bridge closed the connection")
+        self._buffer.extend(data)
+
+    @property
+    def in_waiting(self):
+        with self._read_lock:
+            if not self._buffer:
+                self._receive(0)
+            return len(self._buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise OSError("Bridge port is closed")
+        with self._read_lock:
+            if not self._buffer:
+                self._receive(self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("Bridge port is closed")
+        self._socket.sendall(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self._socket.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Share a GCS serial port with several local clients")
+    parser.add_argument('port', help="serial device, e.g. COM3 or /dev/ttyUSB0")
+    parser.add_argument('--baud', type=int, default=115200, help="serial baud rate")
+    parser.add_argument('--listen', default=DEFAULT_ADDRESS, help="tcp:host:port or unix:path")
+    parser.add_argument('--binary', action='store_true', help="the GCS uses framed binary serial mode")
+    parser.add_argument('--queue', type=int, default=1024, help="units buffered per client")
+    parser.add_argument('--policy', choices=(DROP_OLDEST, DISCONNECT), default=DROP_OLDEST,
+                        help="what to do when a client's queue is full")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    bridge = SerialBridge(args.port, args.baud, args.listen, args.binary, args.queue, args.policy)
+    bridge.start()
+    stop_event = Event()
+    try:
+        # Timed so Ctrl+C is still handled on Windows
+        while not stop_event.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.stop()
+
+if __name__ == "__main__":
+    main()
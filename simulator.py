@@ -0,0 +1,266 @@
+"""Simulated GCS ESP32 for running the ground-station server without hardware.
+
+GCSEmulator reproduces what esp32_gcs.ino and esp32_mcu.ino do together: it
+accepts the text (or framed binary) commands, updates per-drone state, answers
+every command with telemetry and emits periodic telemetry for each drone.
+
+It can be attached two ways:
+  * SimulatedPort - an in-process stand-in for `serial.Serial`, used by the
+    server for `sim:` ports (e.g. `sim:drones=4&rate=10`)
+  * serve_pty - exposes the emulator on a pseudo-terminal so anything that
+    opens a real serial device, pyserial included, can talk to it
+"""
+import argparse
+import os
+import time
+from threading import Condition, Event, Thread
+from urllib.parse import parse_qs
+
+import protocol
+from protocol import CommandType, FlightMode
+
+class SimulatedDrone:
+    """State of one drone as reported in DroneTelemetry"""
+    def __init__(self, drone_id):
+        self.drone_id = drone_id
+        self.altitude = 0.0
+        self.target_altitude = 0.0
+        self.battery = 100.0
+        self.gps_status = 1
+        self.mode = int(FlightMode.STABILIZE)
+        self.armed = False
+        self.satellites = 9
+
+    def apply(self, command, payload=b''):
+        if command == CommandType.ARM:
+            self.armed = True
+        elif command == CommandType.DISARM:
+            self.armed = False
+            self.target_altitude = 0.0
+        elif command == CommandType.TAKEOFF and self.armed:
+            self.target_altitude = 10.0
+        elif command == CommandType.LAND:
+            self.target_altitude = 0.0
+        elif command == CommandType.MODE_CHANGE and payload:
+            self.mode = payload[0]
+
+    def step(self):
+        # Same rates as the placeholder sensor updates in esp32_mcu.ino
+        if self.altitude < self.target_altitude:
+            self.altitude = min(self.altitude + 0.1, self.target_altitude)
+        elif self.altitude > self.target_altitude:
+            self.altitude = max(self.altitude - 0.1, self.target_altitude)
+        self.battery = self.battery - 0.01 if self.battery > 0 else 100.0
+
+    def telemetry(self):
+        return {
+            'altitude': self.altitude,
+            'battery': self.battery,
+            'gps_status': self.gps_status,
+            'mode': self.mode,
+            'armed': self.armed,
+            'satellites': self.satellites,
+        }
+
+class GCSEmulator:
+    """Byte-level model of the GCS ESP32 and the drones behind it.
+
+    `rate` is the periodic telemetry rate per drone in Hz. In text mode every
+    drone but the first is reported as `T,<id>,...` so the server can tell
+    them apart; real firmware only ever reports one drone.
+    """
+    def __init__(self, drones=1, rate=1.0, binary=False):
+        self.drones = {drone_id: SimulatedDrone(drone_id) for drone_id in range(1, drones + 1)}
+        self.rate = rate
+        self.binary = binary
+        self.commands_received = 0
+        self._input = bytearray()
+        self._decoder = protocol.FrameDecoder(protocol.MESSAGE_FRAME_SIZE)
+        self._next_telemetry = time.monotonic()
+
+    def feed(self, data):
+        """Process bytes written by the PC and return the GCS's reply bytes"""
+        output = []
+        if self.binary:
+            for body in self._decoder.feed(data):
+                try:
+                    message = protocol.decode_message(body)
+                except protocol.ProtocolError:
+                    continue
+                output.append(self._execute(message['drone_id'], message['command'], message['payload']))
+            return b''.join(output)
+
+        self._input.extend(data)
+        while True:
+            newline = self._input.find(b'\n')
+            if newline < 0:
+                break
+            line = self._input[:newline].decode(errors='replace').strip()
+            del self._input[:newline + 1]
+            drone_id = 1
+            prefix, separator, rest = line.partition(':')
+            if separator and prefix.isdigit():
+                drone_id, line = int(prefix), rest
+            try:
+                command, payload = protocol.parse_text_command(line)
+            except protocol.ProtocolError:
+                continue  # The firmware silently ignores unknown commands
+            output.append(self._execute(drone_id, command, payload))
+        return b''.join(output)
+
+    def _execute(self, drone_id, command, payload):
+        self.commands_received += 1
+        drone = self.drones.get(drone_id)
+        if drone is None:
+            # No such peer: the ESP-NOW send fails and no telemetry comes back
+            return b'' if self.binary else b'Last Packet Send Status: Delivery Fail\r\n'
+        drone.apply(command, payload)
+        reply = self.encode_telemetry(drone)
+        if self.binary:
+            return reply
+        return b'Last Packet Send Status: Delivery Success\r\n' + reply
+
+    def encode_telemetry(self, drone):
+        telemetry = drone.telemetry()
+        if self.binary:
+            return protocol.frame_telemetry(protocol.encode_telemetry(telemetry))
+        values = [f"{telemetry['altitude']:.2f}", f"{telemetry['battery']:.2f}",
+                  str(telemetry['gps_status']), str(telemetry['mode']),
+                  str(int(telemetry['armed'])), str(telemetry['satellites'])]
+        if drone.drone_id != 1:
+            values.insert(0, str(drone.drone_id))
+        return ('T,' + ','.join(values) + '\r\n').encode()
+
+    def poll(self, now=None):
+        """Return periodic telemetry that is due, and when the next batch is due"""
+        now = time.monotonic() if now is None else now
+        if not self.rate or now < self._next_telemetry:
+            return b'', self._next_telemetry if self.rate else None
+        output = []
+        for drone in self.drones.values():
+            drone.step()
+            output.append(self.encode_telemetry(drone))
+        # Catch up without bursting if the caller fell behind
+        self._next_telemetry = max(self._next_telemetry + 1.0 / self.rate, now)
+        return b''.join(output), self._next_telemetry
+
+    @classmethod
+    def from_spec(cls, spec, binary=False):
+        """Build an emulator from a `drones=4&rate=10` style option string"""
+        options = parse_qs(spec)
+        return cls(
+            drones=int(options.get('drones', ['1'])[0]),
+            rate=float(options.get('rate', ['1'])[0]),
+            binary=binary,
+        )
+
+class SimulatedPort:
+    """In-process stand-in for `serial.Serial` backed by a GCSEmulator"""
+    def __init__(self, emulator, timeout=0.1):
+        self.emulator = emulator
+        self.timeout = timeout
+        self.port = 'sim:'
+        self.is_open = True
+        self._buffer = bytearray()
+        self._cond = Condition()
+        self._closed = Event()
+        self._ticker = Thread(target=self._tick, name='sim-telemetry', daemon=True)
+        self._ticker.start()
+
+    def _tick(self):
+        while not self._closed.is_set():
+            output, next_due = self.emulator.poll()
+            if output:
+                self._push(output)
+            wait = 0.1 if next_due is None else max(next_due - time.monotonic(), 0)
+            self._closed.wait(wait)
+
+    def _push(self, data):
+        with self._cond:
+            self._buffer.extend(data)
+            self._cond.notify_all()
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def read(self, size=1):
+        with self._cond:
+            self._cond.wait_for(lambda: self._buffer or not self.is_open, self.timeout)
+            if not self.is_open:
+                raise OSError("Simulated port is closed")
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("Simulated port is closed")
+        with self._cond:
+            reply = self.emulator.feed(data)
+        if reply:
+            self._push(reply)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+        self._closed.set()
+
+def serve_pty(emulator, stop_event=None):
+    """Run `emulator` on a new pseudo-terminal and return the device path to open.
+
+    The emulator runs on a daemon thread until `stop_event` is set.
+    """
+    import pty
+    import select
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    device = os.ttyname(slave)
+    stop_event = stop_event or Event()
+
+    def run():
+        try:
+            while not stop_event.is_set():
+                output, next_due = emulator.poll()
+                if output:
+                    os.write(master, output)
+                wait = 0.1 if next_due is None else max(min(next_due - time.monotonic(), 0.1), 0)
+                readable, _, _ = select.select([master], [], [], wait)
+                if readable:
+                    reply = emulator.feed(os.read(master, 4096))
+                    if reply:
+                        os.write(master, reply)
+        except OSError:
+            pass  # The other end went away
+        finally:
+            os.close(master)
+            os.close(slave)
+
+    Thread(target=run, name='sim-pty', daemon=True).start()
+    return device
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the GCS ESP32 on a pseudo-terminal")
+    parser.add_argument('--drones', type=int, default=1, help="number of simulated drones")
+    parser.add_argument('--rate', type=float, default=1.0, help="telemetry rate per drone in Hz")
+    parser.add_argument('--binary', action='store_true', help="use framed binary serial mode")
+    args = parser.parse_args()
+
+    stop_event = Event()
+    device = serve_pty(GCSEmulator(args.drones, args.rate, args.binary), stop_event)
+    print(f"Simulated GCS on {device} ({args.drones} drone(s) at {args.rate} Hz)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+if __name__ == "__main__":
+    main()
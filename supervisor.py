@@ -0,0 +1,134 @@
+"""Runs the ground station's long-lived components in one process.
+
+Each component is either a thread that blocks until it is stopped (the HTTP
+server), a service that starts and stops its own threads (the port registry),
+or a child process (the Electron UI). Threads and processes are watched by
+blocking on them rather than polling: one that exits on its own is restarted
+after `restart_delay`, up to `max_restarts` times, unless it is critical, in
+which case the whole application shuts down. Components are stopped in the
+reverse order they were added.
+"""
+import logging
+import signal
+import subprocess
+from threading import Event, Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+class Component:
+    def __init__(self, name, start, stop=None, critical=False):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.critical = critical
+        self.restarts = 0
+
+class Supervisor:
+    def __init__(self, restart_delay=1.0, max_restarts=5):
+        self.restart_delay = restart_delay
+        self.max_restarts = max_restarts
+        self._components = []
+        self._stopping = Event()
+        self._lock = Lock()
+        self._processes = {}
+
+    def add_thread(self, name, run, stop=None, critical=False):
+        """`run` blocks until `stop` is called; an early return or exception counts as a crash"""
+        self._components.append(Component(name, lambda component: self._watch_thread(component, run), stop, critical))
+
+    def add_service(self, name, start, stop=None):
+        """`start` returns once the service is running; it is only stopped, never restarted"""
+        self._components.append(Component(name, lambda component: start(), stop))
+
+    def add_process(self, name, args, critical=False, **popen_kwargs):
+        def stop():
+            with self._lock:
+                process = self._processes.pop(name, None)
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+        self._components.append(Component(
+            name, lambda component: self._watch_process(component, args, popen_kwargs), stop, critical))
+
+    def _watch_thread(self, component, run):
+        def target():
+            while True:
+                try:
+                    run()
+                    if not self._stopping.is_set():
+                        logger.warning(f"{component.name} exited")
+                except Exception as e:
+                    logger.error(f"{component.name} crashed: {e}")
+                if not self._should_restart(component):
+                    return
+        Thread(target=target, name=component.name, daemon=True).start()
+
+    def _watch_process(self, component, args, popen_kwargs):
+        def launch():
+            try:
+                process = subprocess.Popen(args, **popen_kwargs)
+            except OSError as e:
+                logger.error(f"Failed to start {component.name}: {e}")
+                return None
+            with self._lock:
+                self._processes[component.name] = process
+            logger.info(f"Started {component.name} (pid {process.pid})")
+            return process
+
+        def target(process):
+            while process is not None:
+                code = process.wait()  # Blocks; no polling
+                logger.info(f"{component.name} exited with code {code}")
+                if not self._should_restart(component, code):
+                    return
+                process = launch()
+
+        process = launch()
+        if process is None and component.critical:
+            self.shutdown()
+        Thread(target=target, args=(process,), name=f"{component.name}-watch", daemon=True).start()
+
+    def _should_restart(self, component, exit_code=None):
+        if self._stopping.is_set():
+            return False
+        if component.critical:
+            logger.info(f"{component.name} is critical, shutting down")
+            self.shutdown()
+            return False
+        if exit_code == 0 or component.restarts >= self.max_restarts:
+            return False
+        component.restarts += 1
+        logger.info(f"Restarting {component.name} ({component.restarts}/{self.max_restarts})")
+        return not self._stopping.wait(self.restart_delay)
+
+    def start(self):
+        for component in self._components:
+            component.start(component)
+
+    def shutdown(self):
+        self._stopping.set()
+
+    def run(self):
+        """Start every component and block until shutdown() or SIGINT/SIGTERM"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.shutdown())
+        try:
+            self.start()
+            # Timed so Ctrl+C is still handled on Windows, where untimed waits ignore it
+            while not self._stopping.wait(1.0):
+                pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopping.set()
+        for component in reversed(self._components):
+            if component.stop:
+                try:
+                    component.stop()
+                except Exception as e:
+                    logger.error(f"Error stopping {component.name}: {e}")
@@ -0,0 +1,140 @@
+"""In-memory telemetry history kept in fixed-size columnar ring buffers.
+
+Each drone gets one preallocated `array` per telemetry field plus one for
+timestamps, so memory stays flat however long a session runs: once a buffer is
+full the oldest samples are overwritten.
+"""
+from array import array
+from threading import Lock
+
+# Series kept for every drone and their array type codes
+SERIES = (
+    ('altitude', 'f'),
+    ('battery', 'f'),
+    ('gps_status', 'B'),
+    ('mode', 'B'),
+    ('armed', 'B'),
+    ('satellites', 'B'),
+)
+SERIES_NAMES = tuple(name for name, _ in SERIES)
+
+class DroneSeries:
+    """Ring buffer of one drone's telemetry, one column per field"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.columns = {name: array(code, [0]) * capacity for name, code in SERIES}
+        self.head = 0   # Next slot to write
+        self.count = 0
+
+    def append(self, timestamp, frame):
+        slot = self.head
+        self.timestamps[slot] = timestamp
+        for name, column in self.columns.items():
+            column[slot] = frame[name]
+        self.head = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _slot(self, position):
+        """Map a logical position (0 = oldest sample) to a buffer slot"""
+        return (self.head - self.count + position) % self.capacity
+
+    def _bisect(self, timestamp, inclusive=False):
+        """First logical position whose timestamp is >= `timestamp` (> if `inclusive`)"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            value = self.timestamps[self._slot(middle)]
+            if value < timestamp or (inclusive and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, start=None, end=None):
+        """Logical position range covering timestamps in [start, end]"""
+        first = 0 if start is None else self._bisect(start)
+        last = self.count if end is None else self._bisect(end, inclusive=True)
+        return first, max(first, last)
+
+    def read(self, first, last, name):
+        """Values of column `name` (or 'timestamp') between logical positions"""
+        column = self.timestamps if name == 'timestamp' else self.columns[name]
+        first_slot = self._slot(first)
+        length = last - first
+        if first_slot + length <= self.capacity:
+            return column[first_slot:first_slot + length].tolist()
+        # The window wraps around the end of the buffer
+        tail = column[first_slot:].tolist()
+        return tail + column[:length - len(tail)].tolist()
+
+class TelemetryStore:
+    """Per-drone telemetry history with windowed and downsampled queries.
+
+    `record` has the signature of a TelemetryBuffer listener, so the store can
+    be fed straight from the serial reader.
+    """
+    def __init__(self, capacity=36000):
+        # Default capacity holds ten hours at one frame per second per drone
+        self.capacity = capacity
+        self._series = {}
+        self._lock = Lock()
+
+    def record(self, frame):
+        with self._lock:
+            series = self._series.get(frame['drone_id'])
+            if series is None:
+                series = self._series[frame['drone_id']] = DroneSeries(self.capacity)
+            series.append(frame['timestamp'], frame)
+
+    def drones(self):
+        with self._lock:
+            return {drone_id: series.count for drone_id, series in self._series.items()}
+
+    def query(self, drone_id, start=None, end=None, fields=SERIES_NAMES):
+        """Return raw samples between `start` and `end` as {'timestamp': [...], field: [...]}"""
+        self._check_fields(fields)
+        with self._lock:
+            series = self._series.get(drone_id)
+            if series is None:
+                return {name: [] for name in ('timestamp',) + tuple(fields)}
+            first, last = series.window(start, end)
+            return {name: series.read(first, last, name) for name in ('timestamp',) + tuple(fields)}
+
+    def downsample(self, drone_id, points, start=None, end=None, fields=SERIES_NAMES):
+        """Reduce a window to at most `points` buckets for charting.
+
+        Each bucket reports its mean timestamp and the mean, min and max of
+        every field, so spikes survive the reduction.
+        """
+        if points < 1:
+            raise ValueError("points must be at least 1")
+        raw = self.query(drone_id, start, end, fields)
+        total = len(raw['timestamp'])
+        if total <= points:
+            return {
+                'timestamp': raw['timestamp'],
+                **{name: {'mean': values, 'min': values, 'max': values}
+                   for name, values in raw.items() if name != 'timestamp'}
+            }
+
+        bounds = [total * bucket // points for bucket in range(points + 1)]
+        result = {'timestamp': [_mean(raw['timestamp'][a:b]) for a, b in zip(bounds, bounds[1:])]}
+        for name in fields:
+            values = raw[name]
+            buckets = [values[a:b] for a, b in zip(bounds, bounds[1:])]
+            result[name] = {
+                'mean': [_mean(bucket) for bucket in buckets],
+                'min': [min(bucket) for bucket in buckets],
+                'max': [max(bucket) for bucket in buckets],
+            }
+        return result
+
+    @staticmethod
+    def _check_fields(fields):
+        unknown = set(fields) - set(SERIES_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown telemetry fields: {', '.join(sorted(unknown))}")
+
+def _mean(values):
+    return sum(values) / len(values)
@@ -0,0 +1,261 @@
+"""On-disk cache and proxy for the map tiles shown in the UI.
+
+Tiles are fetched from the upstream tile server on first use and kept under
+`<cache dir>/<source>/<z>/<x>/<y>.<ext>`. The cache holds at most `max_bytes`;
+beyond that the least recently used tiles are deleted. Recency is tracked in
+memory and seeded from file mtimes at startup, so a restart keeps the order.
+Concurrent requests for the same missing tile share a single upstream fetch.
+Failures are remembered for `retry_after` seconds: a tile the server refused
+fails straight away until then, and so does every uncached tile of a source
+whose server could not be reached, so a dead or captive link costs one short
+timeout instead of one per tile.
+
+`seed` downloads every tile in a bounding box and zoom range ahead of time, so
+the map works in the field without connectivity:
+
+    python tile_cache.py --bbox -54.40,33.38,-54.30,33.46 --zoom 12-17 --source light
+
+The server and the seeder share one size limit, MAX_CACHE_BYTES (set with the
+GCS_TILE_CACHE_MB environment variable). A seed that would not fit is stopped
+with an error, since the server would evict part of it on its next miss.
+
+Upstream URLs can be overridden (e.g. to point at a local stand-in tile
+server) with the `sources` argument or the `--upstream` option.
+"""
+import argparse
+import logging
+import math
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+logger = logging.getLogger(__name__)
+
+# Layer name -> (upstream URL template, file extension)
+TILE_SOURCES = {
+    'light': ('https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png', 'png'),
+    'satellite': ('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', 'jpg'),
+    'osm': ('https://tile.openstreetmap.org/{z}/{x}/{y}.png', 'png'),
+}
+CONTENT_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg'}
+MAX_ZOOM = 19
+# Disk space for cached tiles, shared by the server and the seeder
+MAX_CACHE_BYTES = int(os.environ.get('GCS_TILE_CACHE_MB', 512)) * 1024 * 1024
+# Tile servers' usage policies require an identifying User-Agent
+USER_AGENT = 'FigmaGUI-GCS tile cache'
+
+class TileUnavailable(Exception):
+    """The tile is not cached and the upstream server could not provide it"""
+
+def tile_for(latitude, longitude, zoom):
+    """Slippy-map (x, y) of the tile containing a point"""
+    n = 2 ** zoom
+    x = int((longitude + 180.0) / 360.0 * n)
+    phi = math.radians(max(min(latitude, 85.0511), -85.0511))
+    y = int((1.0 - math.asinh(math.tan(phi)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_in_bbox(west, south, east, north, min_zoom, max_zoom):
+    """Yield (z, x, y) for every tile covering the box at each zoom level"""
+    for zoom in range(min_zoom, max_zoom + 1):
+        x0, y0 = tile_for(north, west, zoom)
+        x1, y1 = tile_for(south, east, zoom)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield zoom, x, y
+
+class TileCache:
+    def __init__(self, cache_dir, sources=TILE_SOURCES, max_bytes=MAX_CACHE_BYTES, timeout=3.0,
+                 retry_after=30.0):
+        self.cache_dir = cache_dir
+        self.sources = sources
+        self.max_bytes = max_bytes
+        # Kept short: misses are fetched on HTTP worker threads
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._failures = {}  # tile path or source name -> monotonic time to try upstream again
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._size = 0
+        self._inflight = {}  # path -> Event set when its fetch finishes
+        self._loaded = False
+
+    def _load(self):
+        """Index tiles already on disk, oldest first"""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._size += size
+        self._loaded = True
+
+    def path_for(self, source, z, x, y):
+        if source not in self.sources:
+            raise ValueError(f"Unknown tile source {source!r}")
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise ValueError(f"No tile {z}/{x}/{y}")
+        extension = self.sources[source][1]
+        return os.path.join(self.cache_dir, source, str(z), str(x), f"{y}.{extension}")
+
+    def content_type(self, source):
+        return CONTENT_TYPES[self.sources[source][1]]
+
+    def get(self, source, z, x, y):
+        """Return the tile's bytes, fetching and caching it on a miss"""
+        path = self.path_for(source, z, x, y)
+        while True:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                if path in self._entries:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    break
+                self._check_failures(source, path)
+                inflight = self._inflight.get(path)
+                if inflight is None:
+                    inflight = self._inflight[path] = Event()
+                    owner = True
+                    self.misses += 1
+                else:
+                    owner = False
+            if not owner:
+                # Someone else is fetching it; use their result
+                inflight.wait(self.timeout)
+                with self._lock:
+                    if path not in self._entries and path not in self._inflight:
+                        raise TileUnavailable(f"Tile {source}/{z}/{x}/{y} is unavailable")
+                continue
+            try:
+                return self._fetch(source, z, x, y, path)
+            finally:
+                with self._lock:
+                    self._inflight.pop(path).set()
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Deleted behind our back; forget it and fetch again
+            with self._lock:
+                self._size -= self._entries.pop(path, 0)
+            return self.get(source, z, x, y)
+
+    def _check_failures(self, source, path):
+        """Raise TileUnavailable while a recent failure covers the tile; called under the lock"""
+        now = time.monotonic()
+        for key in (source, path):
+            retry_at = self._failures.get(key)
+            if retry_at is None:
+                continue
+            if now < retry_at:
+                tile = os.path.relpath(path, self.cache_dir)
+                raise TileUnavailable(f"Tile {tile} is unavailable, upstream failed recently")
+            del self._failures[key]
+
+    def _fetch(self, source, z, x, y, path):
+        url = self.sources[source][0].format(z=z, x=x, y=y)
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+        except (urllib.error.URLError, OSError) as e:
+            # The server answered for this tile only; anything else means the link is down
+            key = path if isinstance(e, urllib.error.HTTPError) else source
+            with self._lock:
+                self._failures[key] = time.monotonic() + self.retry_after
+            raise TileUnavailable(f"Fetching {url} failed: {e}")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._evict()
+        return data
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self._entries), "bytes": self._size,
+                    "hits": self.hits, "misses": self.misses}
+
+    def seed(self, source, bbox, min_zoom, max_zoom, workers=2, limit=None):
+        """Fetch every tile in `bbox` (west, south, east, north).
+
+        Once the cache holds `limit` bytes the remaining tiles are skipped.
+        Returns (fetched, failed, skipped).
+        """
+        tiles = list(tiles_in_bbox(*bbox, min_zoom, max_zoom))
+        logger.info(f"Seeding {len(tiles)} {source} tiles for zoom {min_zoom}-{max_zoom}")
+
+        def fetch(tile):
+            if limit is not None and self.stats()["bytes"] >= limit:
+                return None
+            try:
+                self.get(source, *tile)
+                return True
+            except TileUnavailable as e:
+                logger.warning(str(e))
+                return False
+
+        # Few workers: public tile servers throttle or ban bulk downloads
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fetch, tiles))
+        return results.count(True), results.count(False), results.count(None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-seed the map tile cache for offline use")
+    parser.add_argument('--bbox', required=True, help="west,south,east,north in degrees")
+    parser.add_argument('--zoom', required=True, help="zoom range, e.g. 12-17")
+    parser.add_argument('--source', default='light', help="tile layer to seed")
+    parser.add_argument('--upstream', help="URL template overriding the layer's upstream server")
+    parser.add_argument('--cache-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiles'))
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    bbox = tuple(float(value) for value in args.bbox.split(','))
+    min_zoom, _, max_zoom = args.zoom.partition('-')
+    sources = dict(TILE_SOURCES)
+    if args.upstream:
+        sources[args.source] = (args.upstream, sources.get(args.source, (None, 'png'))[1])
+    # Seeding never evicts what it just downloaded; it stops at the server's limit instead
+    cache = TileCache(args.cache_dir, sources, max_bytes=float('inf'), timeout=10.0, retry_after=0)
+    fetched, failed, skipped = cache.seed(
+        args.source, bbox, int(min_zoom), int(max_zoom or min_zoom), args.workers, limit=MAX_CACHE_BYTES)
+    print(f"Cached {fetched} tiles ({failed} failed) in {args.cache_dir}")
+    # Workers check the limit before fetching, so the last tiles can still overshoot it
+    if skipped or cache.stats()["bytes"] > MAX_CACHE_BYTES:
+        sys.exit(f"The cache is over the server's {MAX_CACHE_BYTES // (1024 * 1024)} MB limit ({skipped} tiles "
+                 f"skipped), so the server would evict seeded tiles. Raise GCS_TILE_CACHE_MB for both the "
+                 f"seeder and the server, or seed a smaller area.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Opt-in request tracing and an on-demand sampling profiler.
+
+Tracer keeps the most recent spans (name, start, duration, thread) in a ring
+buffer while it is enabled; when disabled `span()` returns a shared no-op
+context, so leaving the hooks in the request path costs one attribute check.
+Spans are exported as Chrome trace JSON (load it in chrome://tracing or
+Perfetto), where spans on the same thread nest by time.
+
+SamplingProfiler snapshots the stack of every thread each `interval` seconds
+from a background thread, without instrumenting the code it measures, so it
+can be started and stopped on a live server. Samples can be exported as a
+Chrome trace (consecutive samples sharing a frame merge into one slice) or as
+a pstats file for `python -m pstats` / snakeviz.
+"""
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.category, self.start, _now_us(), self.args)
+        return False
+
+class Tracer:
+    def __init__(self, capacity=20000, enabled=False):
+        self.enabled = enabled
+        self._spans = deque(maxlen=capacity)
+
+    def span(self, name, category='request', **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def add(self, name, category, start_us, end_us, args=None):
+        """Record a span measured by the caller; times are perf_counter microseconds"""
+        if self.enabled:
+            # deque.append is atomic, so no lock is needed on the hot path
+            self._spans.append((name, category, start_us, end_us - start_us, threading.get_ident(), args))
+
+    def __len__(self):
+        return len(self._spans)
+
+    def clear(self):
+        self._spans.clear()
+
+    def chrome_trace(self):
+        events = [{
+            "name": name, "cat": category, "ph": "X", "ts": start, "dur": duration,
+            "pid": os.getpid(), "tid": thread, "args": args or {},
+        } for name, category, start, duration, thread, args in list(self._spans)]
+        return {"traceEvents": _thread_names() + events, "displayTimeUnit": "ms"}
+
+def _thread_names():
+    return [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident,
+             "args": {"name": thread.name}} for thread in threading.enumerate()]
+
+def _frame_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_samples=200000):
+        self.interval = interval
+        self.max_samples = max_samples
+        self.started_at = None
+        self.stopped_at = None
+        self._started_us = None
+        self._samples = []  # (timestamp us, thread id, stack of frame keys, root first)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def sample_count(self):
+        return len(self._samples)
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        self._samples = []
+        self._stop_event.clear()
+        self.started_at, self.stopped_at = time.time(), None
+        self._started_us = _now_us()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            timestamp = _now_us()
+            for thread, frame in sys._current_frames().items():
+                if thread == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self._samples.append((timestamp, thread, tuple(stack)))
+            if len(self._samples) >= self.max_samples:
+                logger.warning(f"Sampling profiler stopped after {self.max_samples} samples")
+                break  # Bounded memory if someone forgets to stop it
+        self.stopped_at = time.time()
+
+    def chrome_trace(self):
+        """Merge each thread's consecutive samples into nested slices"""
+        events = []
+        per_thread = {}
+        for timestamp, thread, stack in self._samples:
+            per_thread.setdefault(thread, []).append((timestamp, stack))
+        step = int(self.interval * 1e6)
+        for thread, samples in per_thread.items():
+            open_frames = []  # (frame key, start)
+            for timestamp, stack in samples:
+                common = 0
+                while (common < len(open_frames) and common < len(stack)
+                       and open_frames[common][0] == stack[common]):
+                    common += 1
+                for key, start in reversed(open_frames[common:]):
+                    events.append(_slice(key, start, timestamp, thread))
+                del open_frames[common:]
+                open_frames.extend((key, timestamp) for key in stack[common:])
+            end = samples[-1][0] + step
+            for key, start in reversed(open_frames):
+                events.append(_slice(key, start, end, thread))
+        return {"traceEvents": _thread_names() + events, "displayTimeUnit": "ms"}
+
+    def pstats_data(self):
+        """Sample counts in the format pstats.Stats loads: {func: (cc, nc, tt, ct, callers)}.
+
+        Each sample stands for the time since the previous sampling pass, which
+        under GIL contention can be much longer than `interval`.
+        """
+        stats = {}
+        previous = current = self._started_us
+        for timestamp, _, stack in self._samples:
+            if timestamp != current:
+                previous, current = current, timestamp
+            weight = (current - previous) / 1e6
+            if not stack:
+                continue
+            seen = set()
+            for depth, key in enumerate(stack):
+                cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+                leaf = depth == len(stack) - 1
+                own_time = weight if leaf else 0.0
+                # Recursive frames count towards cumulative time only once per sample
+                cumulative = weight if key not in seen else 0.0
+                seen.add(key)
+                if depth:
+                    caller = stack[depth - 1]
+                    c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (c_cc + 1, c_nc + 1, c_tt + own_time, c_ct + cumulative)
+                stats[key] = (cc + 1, nc + 1, tt + own_time, ct + cumulative, callers)
+        return stats
+
+    def dump_pstats(self):
+        """Bytes of a pstats file, as written by cProfile's dump_stats"""
+        return marshal.dumps(self.pstats_data())
+
+def _slice(key, start, end, thread):
+    filename, line, name = key
+    return {"name": name, "cat": "sample", "ph": "X", "ts": start, "dur": max(end - start, 1),
+            "pid": os.getpid(), "tid": thread, "args": {"file": f"{filename}:{line}"}}
+
+# Opt in at startup with GCS_TRACE=1, or at runtime through /debug/tracing
+TRACER = Tracer(enabled=os.environ.get('GCS_TRACE') == '1')